@@ -1,5 +1,6 @@
 import streamlit as st
 from utils.styles import apply_custom_styling
+from utils.data_loaders import load_kpis
 
 # Global configuration
 st.set_page_config(
@@ -31,16 +32,23 @@ def main():
         """
     )
 
-    # Sample Call-to-Action or Highlights
-    st.markdown(
-        """
-        ### Highlights
-        - 👥 Total Users Analyzed: **5,000+**
-        - 🎯 Engagement Score Range: **1-100**
-        - 📶 Clusters Identified: **8**
-        - 🌟 Top Customer Satisfaction Score: **98/100**
-        """
-    )
+    # Highlights from the precomputed KPI artifact
+    artifact = load_kpis()
+    if artifact is None:
+        st.info("KPIs have not been computed yet. Run `python -m scripts.kpi_job` to materialize them.")
+    else:
+        kpis = artifact["kpis"]
+        low, high = kpis["engagement_score_range"]
+        st.markdown(
+            f"""
+            ### Highlights
+            - 👥 Total Users Analyzed: **{kpis['total_users']:,}**
+            - 🎯 Engagement Score Range: **{low:,.2f}-{high:,.2f}**
+            - 📶 Engagement / Experience Clusters: **{kpis['engagement_clusters']} / {kpis['experience_clusters']}**
+            - 🌟 Top Customer Satisfaction Score: **{kpis['top_satisfaction_score']:,.2f}**
+            """
+        )
+        st.caption(f"KPIs version {artifact['version']}, generated {artifact['generated_at']}.")
 
     # # Add navigation buttons
     # st.markdown("#### Quick Navigation")
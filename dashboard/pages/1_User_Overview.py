@@ -1,21 +1,25 @@
 import streamlit as st
 from utils.plots import plot_user_distribution, plot_user_cluster_pie
-from utils.data_loaders import load_user_data
+from utils.data_loaders import load_user_data, load_user_summary
+from utils.tables import paged_table
 
 def show_overview():
     st.title("📊 User Overview")
     st.markdown("### High-Level Insights into Customer Demographics and Data.")
     
-    # Load user data
-    df_users = load_user_data()
+    # Page through the user data instead of loading all of it
     st.markdown("#### Overview of the Dataset")
-    st.dataframe(df_users.head(), height=400)
+    paged_table("users", height=400)
 
-    # KPIs
+    # KPIs from the summary stored with the dataset
+    summary = load_user_summary()
     col1, col2, col3 = st.columns(3)
-    col1.metric("Total Users", df_users["User ID"].nunique())
-    col2.metric("Average Traffic (Bytes)", f"{df_users['Total Traffic'].mean():,.2f}")
-    col3.metric("Unique Clusters", df_users["Cluster"].nunique())
+    col1.metric("Total Users", int(summary.loc["User ID", "Unique"]))
+    col2.metric("Average Traffic (Bytes)", f"{summary.loc['Total Traffic', 'Mean']:,.2f}")
+    col3.metric("Unique Clusters", int(summary.loc["Cluster", "Unique"]))
+
+    # The cluster plots only need the cluster column
+    df_users = load_user_data(columns=["Cluster"])
 
     # Plot: Distribution of Users per Cluster
     st.markdown("#### Cluster Distribution")
@@ -1,17 +1,18 @@
 import streamlit as st
 from utils.data_loaders import load_experience_data
 from utils.plots import plot_experience_distribution, plot_time_on_network_distribution
+from utils.tables import paged_table
 
 def show_experience():
     st.title("🌟 Experience Analysis")
     st.markdown("Discover how users rate their experience.")
 
-    # Load Data
-    df_experience = load_experience_data()
-
-    # Display Data
+    # Display Data one page at a time
     st.markdown("#### Experience Data Overview")
-    st.dataframe(df_experience.head(), height=300)
+    paged_table("experience", height=300)
+
+    # Load only the columns the plots use
+    df_experience = load_experience_data(columns=["Cluster", "Experience Score", "Time on Network"])
 
     # Plot
     st.markdown("#### Experience Score Distribution")
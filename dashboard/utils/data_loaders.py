@@ -1,13 +1,27 @@
-import pandas as pd
+import os
+import json
+from utils.data_store import DATA_DIR, dataset_summary, load_dataset
 
-def load_user_data():
-    return pd.read_csv("data/user_data.csv")
+KPI_PATH = os.getenv("KPI_ARTIFACT_PATH", os.path.join(DATA_DIR, "kpis.json"))
 
-def load_engagement_data():
-    return pd.read_csv("data/load_engagement_data.csv")
+def load_user_data(columns=None):
+    return load_dataset("users", columns)
 
-def load_experience_data():
-    return pd.read_csv("data/experience_data.csv")
+def load_engagement_data(columns=None):
+    return load_dataset("engagement", columns)
 
-def load_combined_data():
-    return pd.read_csv("data/combined_data.csv")
+def load_experience_data(columns=None):
+    return load_dataset("experience", columns)
+
+def load_combined_data(columns=None):
+    return load_dataset("combined", columns)
+
+def load_user_summary():
+    return dataset_summary("users")
+
+def load_kpis():
+    # Written by `python -m scripts.kpi_job`; None until the job has run
+    if not os.path.exists(KPI_PATH):
+        return None
+    with open(KPI_PATH) as file:
+        return json.load(file)
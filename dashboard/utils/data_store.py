@@ -0,0 +1,229 @@
+import os
+import json
+import uuid
+import threading
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+DATA_DIR = os.getenv("DASHBOARD_DATA_DIR", "data")
+STORE_DIR = os.getenv("DASHBOARD_STORE_DIR", os.path.join(DATA_DIR, "store"))
+BATCH_SIZE = 10_000
+
+DATASETS = {
+    "users": "user_data.csv",
+    "engagement": "load_engagement_data.csv",
+    "experience": "experience_data.csv",
+    "combined": "combined_data.csv",
+}
+
+_tables = {}
+_frames = {}
+_derived = {}
+_lock = threading.Lock()
+
+def source_path(name):
+    return os.path.join(DATA_DIR, DATASETS[name])
+
+def store_path(name, version):
+    # Each version gets its own file, so a new version never replaces a file that is still mapped
+    return os.path.join(STORE_DIR, f"{name}-{version}.arrow")
+
+def dataset_version(name):
+    """
+    Version stamp of a dataset, taken from the size and modification time of its source file.
+    """
+    stat = os.stat(source_path(name))
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+def _stored_version(path):
+    try:
+        with pa.memory_map(path) as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return None
+    return metadata.get(b"dashboard_version", b"").decode() or None
+
+def _summarize(dataframe):
+    """
+    Per-column KPIs (count, unique values and, for numeric columns, mean/min/max) stored with the dataset.
+    """
+    summary = {}
+    for col in dataframe.columns:
+        series = dataframe[col]
+        stats = {'Count': int(series.count()), 'Unique': int(series.nunique())}
+        if series.dtype.kind in 'iuf':
+            for key, value in (('Mean', series.mean()), ('Min', series.min()), ('Max', series.max())):
+                stats[key] = None if pd.isna(value) else float(value)
+        summary[col] = stats
+    return summary
+
+def _materialize(name, version):
+    """
+    Converts the source CSV into an uncompressed Arrow IPC file of fixed-size record batches,
+    with the version stamp and a per-column summary in the schema metadata.
+    """
+    path = store_path(name, version)
+    dataframe = pd.read_csv(source_path(name))
+    table = pa.Table.from_pandas(dataframe, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        b"dashboard_version": version.encode(),
+        b"dashboard_summary": json.dumps({'rows': len(dataframe), 'columns': _summarize(dataframe)}).encode()
+    })
+
+    os.makedirs(STORE_DIR, exist_ok=True)
+    temporary_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with pa.OSFile(temporary_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table, max_chunksize=BATCH_SIZE)
+    try:
+        os.replace(temporary_path, path)
+    except PermissionError:
+        # Another process stored (and mapped) the same version first; its file is identical
+        if not os.path.exists(path):
+            raise
+        os.remove(temporary_path)
+
+def _remove_stale(name, version):
+    """
+    Deletes the store files of older versions of a dataset. Files still mapped by a live table
+    (here or in another process) cannot be deleted on Windows; they are retried on the next call.
+    """
+    current = os.path.basename(store_path(name, version))
+    if not os.path.isdir(STORE_DIR):
+        return
+    for entry in os.listdir(STORE_DIR):
+        if entry.startswith(f"{name}-") and entry.endswith(".arrow") and entry != current:
+            try:
+                os.remove(os.path.join(STORE_DIR, entry))
+            except OSError:
+                pass
+
+def get_table(name):
+    """
+    Returns a dataset as a memory-mapped Arrow table shared by every page of this process.
+
+    The Arrow file is (re)built only when the source CSV changed; otherwise the table is mapped
+    from disk without copying or parsing, and slices and column selections of it are zero-copy.
+    A new version is written to its own file and older files are deleted once nothing maps them.
+
+    Args:
+    - name (str): One of `DATASETS`.
+
+    Returns:
+    - tuple: (pa.Table, version)
+    """
+    version = dataset_version(name)
+    with _lock:
+        cached = _tables.get(name)
+        if cached is not None and cached[1] == version:
+            return cached
+        path = store_path(name, version)
+        if _stored_version(path) != version:
+            _materialize(name, version)
+        # The mapping outlives the file handle for as long as the table's buffers are alive
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all()
+        _tables[name] = (table, version)
+        for key in [key for key in _frames if key[0] == name]:
+            del _frames[key]
+        for key in [key for key in _derived if key[0][0] == name]:
+            del _derived[key]
+        _remove_stale(name, version)
+        return _tables[name]
+
+def load_dataset(name, columns=None):
+    """
+    Returns a dataset as a pandas DataFrame backed by the shared Arrow store.
+
+    Each (dataset, columns) frame is converted once per dataset version and the same object is
+    handed to every page and session, so reruns neither parse nor copy anything. With columns,
+    only those columns are read from the memory map. Treat it as read-only.
+
+    Args:
+    - name (str): One of `DATASETS`.
+    - columns (list or None): Columns to return. Defaults to all columns.
+
+    Returns:
+    - pd.DataFrame: The dataset.
+    """
+    table, version = get_table(name)
+    key = (name, tuple(columns) if columns is not None else None)
+    with _lock:
+        cached = _frames.get(key)
+        if cached is None or cached[1] != version:
+            projected = table.select(list(columns)) if columns is not None else table
+            cached = (projected.to_pandas(split_blocks=True), version)
+            _frames[key] = cached
+        return cached[0]
+
+def dataset_summary(name):
+    """
+    Returns the per-column summary computed when the dataset was stored, without reading its rows.
+
+    Returns:
+    - pd.DataFrame: 'Count', 'Unique', 'Mean', 'Min' and 'Max' indexed by column.
+    """
+    table, _ = get_table(name)
+    summary = json.loads(table.schema.metadata[b"dashboard_summary"])
+    return pd.DataFrame.from_dict(summary['columns'], orient='index').reindex(columns=['Count', 'Unique', 'Mean', 'Min', 'Max'])
+
+def num_rows(name):
+    return get_table(name)[0].num_rows
+
+def read_rows(name, offset=0, limit=100, columns=None):
+    """
+    Reads one page of rows. The slice is zero-copy, so only the record batches that
+    cover [offset, offset + limit) are touched in the memory map.
+    """
+    table, _ = get_table(name)
+    page = table.slice(offset, limit)
+    if columns is not None:
+        page = page.select(list(columns))
+    return page.to_pandas().set_axis(np.arange(offset, offset + page.num_rows))
+
+def identify(dataframe):
+    """
+    Returns ((name, columns), version) if the dataframe is a shared frame of a dataset, else None.
+    """
+    with _lock:
+        for key, (frame, version) in _frames.items():
+            if frame is dataframe:
+                return key, version
+    return None
+
+def memoize(dataframe, key, compute):
+    """
+    Caches a result derived from a dataset frame until the dataset version changes.
+
+    Only the shared frames returned by `load_dataset` are cached; any other dataframe
+    (e.g. a filtered copy) is computed directly.
+
+    Args:
+    - dataframe (pd.DataFrame): Frame the result is derived from.
+    - key (tuple): Hashable description of the computation and its parameters.
+    - compute (callable): Zero-argument function producing the result.
+    """
+    dataset = identify(dataframe)
+    if dataset is None:
+        return compute()
+    cache_key = (*dataset, key)
+    with _lock:
+        if cache_key in _derived:
+            return _derived[cache_key]
+    result = compute()
+    with _lock:
+        _derived[cache_key] = result
+    return result
+
+def clear_store():
+    """
+    Forgets every table loaded by this process (the Arrow files of the current versions stay on disk).
+    """
+    with _lock:
+        versions = {name: version for name, (_, version) in _tables.items()}
+        _tables.clear()
+        _frames.clear()
+        _derived.clear()
+        for name, version in versions.items():
+            _remove_stale(name, version)
@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+from utils.data_store import memoize
+
+POINT_BUDGET = 5_000
+HISTOGRAM_BINS = 50
+
+def _groups(df, by):
+    if by is None:
+        return [(None, df)]
+    return list(df.groupby(by, sort=True))
+
+def histogram_bins(df, column, by=None, bins=HISTOGRAM_BINS):
+    """
+    Pre-bins a column server-side, with edges shared by every group.
+
+    Returns:
+    - pd.DataFrame: 'Bin Start', 'Bin End', 'Bin Center', 'Count' (and the group column) per non-empty bin.
+    """
+    def compute():
+        values = df[column].to_numpy(dtype='float64', na_value=np.nan)
+        edges = np.histogram_bin_edges(values[~np.isnan(values)], bins=bins)
+        parts = []
+        for group, part in _groups(df, by):
+            counts, _ = np.histogram(part[column].dropna().to_numpy(dtype='float64'), bins=edges)
+            frame = pd.DataFrame({'Bin Start': edges[:-1], 'Bin End': edges[1:], 'Bin Center': (edges[:-1] + edges[1:]) / 2, 'Count': counts})
+            if by is not None:
+                frame.insert(0, by, str(group))
+            parts.append(frame[frame['Count'] > 0])
+        return pd.concat(parts, ignore_index=True)
+    return memoize(df, ('histogram', column, by, bins), compute)
+
+def category_counts(df, column):
+    """
+    Number of rows per category, largest first.
+    """
+    def compute():
+        counts = df[column].value_counts().reset_index()
+        counts.columns = [column, 'Count']
+        return counts
+    return memoize(df, ('counts', column), compute)
+
+def box_statistics(df, column, by=None):
+    """
+    Box plot statistics per group: quartiles, mean and whiskers at the furthest values within 1.5 IQR.
+
+    Returns:
+    - pd.DataFrame: One row per 'Group' with 'Q1', 'Median', 'Q3', 'Mean', 'Lower Fence' and 'Upper Fence'.
+    """
+    def compute():
+        rows = []
+        for group, part in _groups(df, by):
+            values = part[column].dropna().to_numpy(dtype='float64')
+            if len(values) == 0:
+                continue
+            q1, median, q3 = np.quantile(values, [0.25, 0.5, 0.75])
+            iqr = q3 - q1
+            rows.append({
+                'Group': str(group) if by is not None else column,
+                'Q1': q1, 'Median': median, 'Q3': q3, 'Mean': values.mean(),
+                'Lower Fence': values[values >= q1 - 1.5 * iqr].min(),
+                'Upper Fence': values[values <= q3 + 1.5 * iqr].max(),
+            })
+        return pd.DataFrame(rows)
+    return memoize(df, ('box', column, by), compute)
+
+def downsample(df, budget=POINT_BUDGET, stratify_by=None, random_state=42):
+    """
+    Returns at most `budget` rows, sampled per stratum in proportion to its size.
+
+    Every stratum keeps at least one row, so small clusters stay visible. Frames within
+    the budget are returned unchanged.
+    """
+    if len(df) <= budget:
+        return df
+
+    def compute():
+        if stratify_by is None:
+            return df.sample(n=budget, random_state=random_state)
+        sizes = df[stratify_by].value_counts()
+        quotas = np.maximum(1, np.floor(sizes * budget / len(df))).astype(int)
+        parts = [part.sample(n=min(quotas[group], len(part)), random_state=random_state)
+                 for group, part in df.groupby(stratify_by, sort=True)]
+        return pd.concat(parts).sort_index()
+    return memoize(df, ('downsample', budget, stratify_by, random_state), compute)
+
+def top_rows(df, column, n=10):
+    """
+    The n rows with the largest values of a column.
+    """
+    return memoize(df, ('top', column, n), lambda: df.nlargest(n, column))
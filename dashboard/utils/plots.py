@@ -1,24 +1,46 @@
 import plotly.express as px
+import plotly.graph_objects as go
+from utils.plot_data import box_statistics, category_counts, downsample, histogram_bins, top_rows
+
+# Figures are built from server-side aggregates or bounded samples, so payloads stay small
+# however many users the datasets hold.
+
+def _box_figure(df, column, by, title, x_title=None):
+    stats = box_statistics(df, column, by)
+    fig = go.Figure()
+    for _, row in stats.iterrows():
+        fig.add_trace(go.Box(
+            name=row["Group"], x=[row["Group"]] if x_title else None,
+            q1=[row["Q1"]], median=[row["Median"]], q3=[row["Q3"]], mean=[row["Mean"]],
+            lowerfence=[row["Lower Fence"]], upperfence=[row["Upper Fence"]], boxpoints=False
+        ))
+    fig.update_layout(title=title, yaxis_title=column, xaxis_title=x_title, legend_title=by)
+    return fig
 
 def plot_user_distribution(df):
-    return px.histogram(df, x="Cluster", color="Cluster", title="User Cluster Distribution")
+    counts = category_counts(df, "Cluster").astype({"Cluster": str})
+    return px.bar(counts, x="Cluster", y="Count", color="Cluster", title="User Cluster Distribution")
 
 def plot_engagement_distribution(df):
-    return px.histogram(df, x="Engagement Score", color="Cluster", title="Engagement Scores by Cluster")
+    bins = histogram_bins(df, "Engagement Score", by="Cluster")
+    fig = px.bar(bins, x="Bin Center", y="Count", color="Cluster", title="Engagement Scores by Cluster",
+                 labels={"Bin Center": "Engagement Score"})
+    fig.update_traces(width=(bins["Bin End"] - bins["Bin Start"]).iloc[0] if len(bins) else None)
+    return fig.update_layout(bargap=0)
 
 def plot_engagement_boxplot(df):
-    return px.box(df, y="Engagement Score", color="Cluster", title="Engagement Score Spread")
+    return _box_figure(df, "Engagement Score", "Cluster", "Engagement Score Spread")
 
 def plot_experience_distribution(df):
-    return px.box(df, y="Experience Score", color="Cluster", title="Experience Score Spread")
+    return _box_figure(df, "Experience Score", "Cluster", "Experience Score Spread")
 
 def plot_satisfaction_scores(df):
-    top_users = df.sort_values("Satisfaction Score", ascending=False).head(10)
+    top_users = top_rows(df, "Satisfaction Score", 10)
     return px.bar(top_users, x="User ID", y="Satisfaction Score", color="Satisfaction Score", title="Top 10 Satisfied Customers")
 
 def plot_engagement_vs_experience(df):
     return px.scatter(
-        df,
+        downsample(df, stratify_by="Cluster"),
         x="Engagement Score",
         y="Experience Score",
         color="Cluster",
@@ -28,13 +50,12 @@ def plot_engagement_vs_experience(df):
     )
 
 def plot_user_cluster_pie(df):
-    cluster_counts = df['Cluster'].value_counts().reset_index()
-    cluster_counts.columns = ['Cluster', 'Count']
+    cluster_counts = category_counts(df, "Cluster")
     return px.pie(cluster_counts, values='Count', names='Cluster', title="Cluster Distribution (Pie Chart)")
 
 def plot_user_traffic_vs_satisfaction(df):
     return px.scatter(
-        df,
+        downsample(df, stratify_by="Cluster"),
         x="Total Traffic",
         y="Satisfaction Score",
         color="Cluster",
@@ -44,11 +65,11 @@ def plot_user_traffic_vs_satisfaction(df):
     )
 
 def plot_time_on_network_distribution(df):
-    return px.box(df, x="Cluster", y="Time on Network", color="Cluster", title="Time on Network by Cluster")
+    return _box_figure(df, "Time on Network", "Cluster", "Time on Network by Cluster", x_title="Cluster")
 
 def plot_combined_metrics(df):
     return px.parallel_coordinates(
-        df,
+        downsample(df, stratify_by="Cluster"),
         dimensions=["Engagement Score", "Experience Score", "Satisfaction Score"],
         color="Cluster",
         title="Parallel Coordinates of Metrics by Cluster",
@@ -0,0 +1,10 @@
+import streamlit as st
+from utils.data_store import num_rows, read_rows
+
+def paged_table(name, page_size=100, height=400):
+    """
+    Shows a dataset one page at a time, reading only the rows of the selected page.
+    """
+    pages = max(1, -(-num_rows(name) // page_size))
+    page = st.number_input(f"Page (of {pages:,})", min_value=1, max_value=pages, value=1, step=1, key=f"{name}_page")
+    st.dataframe(read_rows(name, (page - 1) * page_size, page_size), height=height)
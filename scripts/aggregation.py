@@ -1,57 +1,163 @@
+import time
+import joblib
 import numpy as np
 import pandas as pd
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.linear_model import LinearRegression
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import MinMaxScaler, StandardScaler
-from sklearn.metrics import mean_squared_error, r2_score, pairwise_distances
+from sklearn.metrics import mean_squared_error, r2_score, pairwise_distances, silhouette_score
+from joblib import Parallel, delayed, effective_n_jobs
 from scipy.spatial.distance import euclidean
+from scripts.sql_queries import APPLICATIONS, execute_queries
+from scripts.top_k import TopKAccumulator
+from scripts.preprocessing.data_loaders import stream_data_from_postgres_db
 
-def aggregate_engagement_metrics(dataframe):
+def _iter_chunks(data):
+    """
+    Yields DataFrame chunks from either a single DataFrame or an iterable of DataFrames
+    (e.g. the generator returned by `stream_data_from_postgres_db`).
+    """
+    if isinstance(data, pd.DataFrame):
+        yield data
+    else:
+        yield from data
+
+def _combine_partials(state, partial, agg_functions):
+    """
+    Folds a per-user partial aggregate into the running state.
+    """
+    if state is None:
+        return partial
+    return pd.concat([state, partial]).groupby(level=0, sort=True).agg(agg_functions)
+
+class EngagementAccumulator:
+    """
+    Mergeable per-user engagement state (session count, duration and UL/DL sums).
+
+    Session chunks are folded in with `update`, partial states from other workers or
+    previous days are combined with `merge`, and `finalize` produces the same table as
+    `aggregate_engagement_metrics`. Each chunk costs a single groupby pass.
+    """
+
+    STATE_COLUMNS = ['Session Frequency', 'Total Session Duration', 'Total DL (Bytes)', 'Total UL (Bytes)']
+
+    def __init__(self, state=None):
+        self.state = state
+
+    def update(self, chunk):
+        """
+        Folds a chunk of session rows into the running state.
+
+        Args:
+        - chunk (DataFrame): Session rows with 'MSISDN/Number', 'Dur. (ms)', 'Total DL (Bytes)' and 'Total UL (Bytes)'.
+
+        Returns:
+        - EngagementAccumulator: self, to allow chaining.
+        """
+        partial = chunk.groupby('MSISDN/Number').agg(
+            **{
+                'Session Frequency': ('Dur. (ms)', 'count'),
+                'Total Session Duration': ('Dur. (ms)', 'sum'),
+                'Total DL (Bytes)': ('Total DL (Bytes)', 'sum'),
+                'Total UL (Bytes)': ('Total UL (Bytes)', 'sum')
+            }
+        )
+        self._fold(partial)
+        return self
+
+    def merge(self, other):
+        """
+        Merges the state of another accumulator into this one.
+
+        Args:
+        - other (EngagementAccumulator): Accumulator built over a disjoint set of sessions.
+
+        Returns:
+        - EngagementAccumulator: self, to allow chaining.
+        """
+        if other.state is not None:
+            self._fold(other.state)
+        return self
+
+    def _fold(self, partial):
+        if self.state is None:
+            self.state = partial
+        else:
+            self.state = pd.concat([self.state, partial]).groupby(level=0, sort=True).sum()
+
+    def finalize(self):
+        """
+        Produces the per-user engagement table.
+
+        Returns:
+        - DataFrame: Same columns as `aggregate_engagement_metrics`.
+        """
+        state = self.state
+        if state is None:
+            state = pd.DataFrame(columns=self.STATE_COLUMNS).rename_axis('MSISDN/Number')
+        engagement_metrics = state.reset_index()
+        engagement_metrics['Total Traffic'] = engagement_metrics['Total DL (Bytes)'] + engagement_metrics['Total UL (Bytes)']
+        return engagement_metrics
+
+    def save(self, path):
+        """
+        Persists the accumulated state to a Parquet file.
+        """
+        if self.state is None:
+            raise ValueError("Nothing to save: the accumulator is empty.")
+        self.state.to_parquet(path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Restores an accumulator previously written with `save`.
+        """
+        return cls(pd.read_parquet(path))
+
+def aggregate_engagement_metrics(dataframe, top_n=None):
     """
     Aggregates engagement metrics (session frequency, session duration, total traffic) per user (MSISDN).
     
     Args:
-    - dataframe (DataFrame): The dataframe containing session data with relevant columns such as 
+    - dataframe (DataFrame or iterable of DataFrames): The dataframe containing session data with relevant columns such as 
                       ['MSISDN/Number', 'Dur. (ms)', 'Total UL (Bytes)', 'Total DL (Bytes)'].
+                      An iterable of chunks is aggregated chunk by chunk, so peak memory is bounded by the chunk size.
+    - top_n (int or None): Also return the top users per metric (see `top_10_engagement`), collected with bounded heaps.
+                           A user's totals are only final once every chunk is folded in (their sessions can span
+                           chunks), so the heaps are fed from the finalized table, one pass over the users, not the sessions.
     
     Returns:
     - DataFrame: A DataFrame containing aggregated metrics per user (MSISDN).
+    - Tuple: Top users by session frequency, session duration and total traffic, if top_n is given.
     """
+    accumulator = EngagementAccumulator()
+    for chunk in _iter_chunks(dataframe):
+        accumulator.update(chunk)
     
-    # Aggregate session frequency: Count the number of sessions per user (MSISDN)
-    session_frequency = dataframe.groupby('MSISDN/Number')['Dur. (ms)'].count().reset_index(name='Session Frequency')
-    
-    # Aggregate session duration: Sum the session duration for each user (MSISDN)
-    session_duration = dataframe.groupby('MSISDN/Number')['Dur. (ms)'].sum().reset_index(name='Total Session Duration')
-    
-    # Aggregate total traffic: Sum up both download and upload data for each user (MSISDN)
-    total_traffic = dataframe.groupby('MSISDN/Number')[['Total DL (Bytes)', 'Total UL (Bytes)']].sum().reset_index()
-    total_traffic['Total Traffic'] = total_traffic['Total DL (Bytes)'] + total_traffic['Total UL (Bytes)']
-    
-    # Merge all aggregated metrics
-    engagement_metrics = session_frequency.merge(session_duration, on='MSISDN/Number', how='inner') \
-                                         .merge(total_traffic, on='MSISDN/Number', how='inner') 
-    
+    engagement_metrics = accumulator.finalize()
+    if top_n is not None:
+        return engagement_metrics, top_10_engagement(engagement_metrics, n=top_n)
     return engagement_metrics
 
-def top_10_engagement(dataframe):
+def top_10_engagement(dataframe, n=10):
     """
     Reports the top 10 users based on session frequency, session duration, and total traffic.
     
     Args:
-    - dataframe (DataFrame): The dataframe with aggregated engagement metrics.
+    - dataframe (DataFrame or iterable of DataFrames): The dataframe (or chunks) with aggregated engagement metrics.
+    - n (int): Number of users per metric.
     
     Returns:
     - Tuple: Three dataframes - Top 10 users by session frequency, session duration, and total traffic.
     """
-    # Get top 10 customers by each engagement metric
-    top_10_session_frequency = dataframe.nlargest(10, 'Session Frequency')
-    top_10_session_duration = dataframe.nlargest(10, 'Total Session Duration')
-    top_10_traffic = dataframe.nlargest(10, 'Total Traffic')
+    # Track the top customers of all three engagement metrics in one pass
+    top_k = TopKAccumulator(n, metrics=['Session Frequency', 'Total Session Duration', 'Total Traffic'])
+    for chunk in _iter_chunks(dataframe):
+        top_k.update(chunk)
     
-    return top_10_session_frequency, top_10_session_duration, top_10_traffic
+    return top_k.result('Session Frequency'), top_k.result('Total Session Duration'), top_k.result('Total Traffic')
 
 def normalize_features(dataframe,  features=['Session Frequency', 'Total Session Duration', 'Total Traffic'], normalize_type='minmax'):
     """
@@ -78,31 +184,198 @@ def normalize_features(dataframe,  features=['Session Frequency', 'Total Session
     
     return dataframe
 
-def kmeans_clustering(dataframe, features, n_clusters=3):
+def _chunk_passes(data):
+    """
+    Returns a zero-argument function yielding the chunks of data afresh on each call.
+
+    data can be a DataFrame, a collection of chunks, a callable returning a new chunk iterator
+    (e.g. `lambda: stream_data_from_postgres_db(...)`) or a one-shot iterator, which can be read only once.
+    """
+    if isinstance(data, pd.DataFrame):
+        return lambda: iter([data])
+    if callable(data):
+        return data
+    if iter(data) is not data:
+        return lambda: iter(data)
+
+    consumed = []
+    def one_shot():
+        if consumed:
+            raise ValueError("A chunk iterator can only be read once; pass a list of chunks or a callable returning a new iterator.")
+        consumed.append(True)
+        return data
+    return one_shot
+
+def _fit_scaler(dataframe, features, scaled, batch_size=None):
+    """
+    Fits a StandardScaler on the features (incrementally over row slices of each chunk when batch_size is given).
+    """
+    if not scaled:
+        return None
+    scaler = StandardScaler()
+    if batch_size is None:
+        return scaler.fit(dataframe[features])
+    for chunk in _iter_chunks(dataframe):
+        for start in range(0, len(chunk), batch_size):
+            scaler.partial_fit(chunk[features].iloc[start:start + batch_size])
+    return scaler
+
+def _scaled_batches(dataframe, features, scaler, batch_size):
+    for start in range(0, len(dataframe), batch_size):
+        batch = dataframe[features].iloc[start:start + batch_size]
+        yield scaler.transform(batch) if scaler is not None else batch.to_numpy()
+
+def assign_clusters(dataframe, model, batch_size=100_000):
+    """
+    Assigns clusters with a fitted (or persisted) clustering model, one batch of rows at a time.
+
+    Args:
+    - dataframe (DataFrame): Rows to assign, containing the model's features.
+    - model (dict or str): Bundle returned by `kmeans_clustering(..., model_path=...)` or its path.
+    - batch_size (int): Rows scaled and predicted at a time.
+
+    Returns:
+    - np.ndarray: Cluster label per row.
+    """
+    if isinstance(model, str):
+        model = joblib.load(model)
+    labels = [model['kmeans'].predict(batch) for batch in _scaled_batches(dataframe, model['features'], model['scaler'], batch_size)]
+    return np.concatenate(labels) if labels else np.empty(0, dtype=np.int32)
+
+def kmeans_clustering(dataframe, features, n_clusters=3, scaled=True, backend='full', batch_size=10_000, sample_size=50_000,
+                      stratify_by=None, model_path=None, random_state=42):
     """
     Performs K-means clustering on the selected features.
 
     Args:
-    - dataframe (DataFrame): The dataframe containing the features to cluster.
+    - dataframe (DataFrame or chunks): The dataframe containing the features to cluster. The 'minibatch'
+                                       backend also accepts chunks out of core: a list of DataFrames or a
+                                       callable returning a new chunk iterator (read twice when scaled),
+                                       or a one-shot iterator when scaled=False.
     - features (list): List of column names to use for clustering.
     - n_clusters (int): Number of clusters.
+    - scaled (bool): Standardize the features before clustering.
+    - backend (str): 'full' fits KMeans on every row; 'minibatch' streams row batches through
+                     StandardScaler.partial_fit and MiniBatchKMeans.partial_fit (rows should not be sorted by the features);
+                     'sampled' fits KMeans on a (stratified) sample and assigns every row with a batched predict.
+    - batch_size (int): Rows per batch for the 'minibatch' backend and for batched assignment.
+    - sample_size (int): Number of rows fitted by the 'sampled' backend.
+    - stratify_by (str or None): Column to stratify the 'sampled' backend's sample on.
+    - model_path (str or None): If given, the fitted scaler and model are persisted there with joblib
+                                so new users can be assigned with `assign_clusters`.
+    - random_state (int): Seed for the model and the sample.
 
     Returns:
-    - DataFrame: DataFrame with a new 'Cluster' column representing cluster assignments.
+    - DataFrame: DataFrame with a new 'Cluster' column representing cluster assignments
+                 (None for chunked input; assign each chunk with `assign_clusters`).
+    - KMeans or MiniBatchKMeans: The fitted model.
+    - DataFrame: The cluster centroids (in scaled space when scaled=True).
     """
-    
-    scaler = StandardScaler()
-    scaled_features = scaler.fit_transform(dataframe[features])
+    if backend != 'minibatch' and not isinstance(dataframe, pd.DataFrame):
+        raise ValueError("Only the 'minibatch' backend accepts chunked input.")
+
+    # Models are always fitted on NumPy arrays, like the batches `assign_clusters` predicts on
+    if backend == 'full':
+        scaler = _fit_scaler(dataframe, features, scaled)
+        selected_features = scaler.transform(dataframe[features]) if scaler is not None else dataframe[features].to_numpy()
+        kmeans = KMeans(n_clusters=n_clusters, random_state=random_state)
+        dataframe['Cluster'] = kmeans.fit_predict(selected_features)
+
+    elif backend == 'minibatch':
+        chunks = _chunk_passes(dataframe)
+        scaler = _fit_scaler(chunks(), features, scaled, batch_size=batch_size) if scaled else None
+        kmeans = MiniBatchKMeans(n_clusters=n_clusters, batch_size=batch_size, random_state=random_state)
+        for chunk in chunks():
+            for batch in _scaled_batches(chunk, features, scaler, batch_size):
+                kmeans.partial_fit(batch)
+        if isinstance(dataframe, pd.DataFrame):
+            dataframe['Cluster'] = assign_clusters(dataframe, {'kmeans': kmeans, 'scaler': scaler, 'features': features}, batch_size)
+        else:
+            dataframe = None
+
+    elif backend == 'sampled':
+        if len(dataframe) <= sample_size:
+            sample = dataframe
+        elif stratify_by is not None:
+            sample = dataframe.groupby(stratify_by, group_keys=False, observed=True).sample(frac=sample_size / len(dataframe), random_state=random_state)
+        else:
+            sample = dataframe.sample(n=sample_size, random_state=random_state)
+        scaler = _fit_scaler(sample, features, scaled)
+        kmeans = KMeans(n_clusters=n_clusters, random_state=random_state)
+        kmeans.fit(scaler.transform(sample[features]) if scaler is not None else sample[features].to_numpy())
+        dataframe['Cluster'] = assign_clusters(dataframe, {'kmeans': kmeans, 'scaler': scaler, 'features': features}, batch_size)
+
+    else:
+        raise ValueError("Invalid backend. Use 'full', 'minibatch' or 'sampled'.")
 
-    # Apply KMeans clustering
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-    dataframe['Cluster'] = kmeans.fit_predict(scaled_features)
+    if model_path is not None:
+        joblib.dump({'kmeans': kmeans, 'scaler': scaler, 'features': list(features)}, model_path)
     
     # Cluster descriptions based on centroids
     cluster_centroids = pd.DataFrame(kmeans.cluster_centers_, columns=features)
 
     return dataframe, kmeans, cluster_centroids
 
+def _fit_k(scaled_features, k, silhouette_sample_size, random_state):
+    """
+    Fits one KMeans model for the k sweep and scores it.
+    """
+    start = time.perf_counter()
+    kmeans = KMeans(n_clusters=k, random_state=random_state).fit(scaled_features)
+    fit_seconds = time.perf_counter() - start
+
+    silhouette = np.nan
+    if 1 < k < len(scaled_features):
+        silhouette = silhouette_score(scaled_features, kmeans.labels_, sample_size=min(silhouette_sample_size, len(scaled_features)),
+                                      random_state=random_state)
+    return {'k': k, 'Inertia': kmeans.inertia_, 'Silhouette': silhouette, 'Fit Seconds': fit_seconds}
+
+def sweep_k(dataframe, features, max_k=10, scaled=True, n_jobs=-1, silhouette_sample_size=10_000, min_improvement=None, patience=1, random_state=42):
+    """
+    Fits K-means for k = 1..max_k in parallel to choose the number of clusters (elbow / silhouette).
+
+    The features are standardized once and shared with every worker. When min_improvement is set, the
+    sweep runs in rounds of n_jobs values of k and stops once the relative inertia drop between
+    consecutive k stays below min_improvement for `patience` steps.
+
+    Args:
+    - dataframe (DataFrame): The dataframe containing the features to cluster.
+    - features (list): List of column names to use for clustering.
+    - max_k (int): Largest number of clusters to try.
+    - scaled (bool): Standardize the features before clustering.
+    - n_jobs (int): Number of worker processes (-1 for all cores).
+    - silhouette_sample_size (int): Rows sampled to compute the silhouette score.
+    - min_improvement (float or None): Relative inertia improvement below which the elbow is reached.
+    - patience (int): Consecutive k below min_improvement required to stop early.
+    - random_state (int): Seed for the models and the silhouette sample.
+
+    Returns:
+    - DataFrame: 'k', 'Inertia', 'Silhouette' and 'Fit Seconds' for each k fitted.
+    """
+    scaled_features = dataframe[features].to_numpy(dtype='float64')
+    if scaled:
+        scaled_features = StandardScaler().fit_transform(scaled_features)
+
+    round_size = max_k if min_improvement is None else effective_n_jobs(n_jobs)
+    results = []
+    with Parallel(n_jobs=n_jobs) as parallel:
+        for first_k in range(1, max_k + 1, round_size):
+            ks = range(first_k, min(first_k + round_size, max_k + 1))
+            results.extend(parallel(delayed(_fit_k)(scaled_features, k, silhouette_sample_size, random_state) for k in ks))
+            if min_improvement is not None and _elbow_reached([result['Inertia'] for result in results], min_improvement, patience):
+                break
+
+    return pd.DataFrame(results)
+
+def _elbow_reached(inertias, min_improvement, patience):
+    below = 0
+    for previous, current in zip(inertias, inertias[1:]):
+        improvement = (previous - current) / previous if previous > 0 else 0
+        below = below + 1 if improvement < min_improvement else 0
+        if below >= patience:
+            return True
+    return False
+
 def cluster_statistics(dataframe, features, aggregations=['min', 'max', 'mean', 'sum']):
     """
     Computes cluster statistics for the specified features.
@@ -152,30 +425,56 @@ def aggregate_application_traffic(dataframe):
     
     return agg_app_traffic
 
-def agg_top_user_per_app(dataframe):
+def agg_top_user_per_app(dataframe, applications=APPLICATIONS, top_n=10):
     """
-    Aggregates the total traffic per application and derives the top 10 most engaged users.
+    Aggregates the total (DL + UL) traffic per user and application and derives the top users per application.
+
+    The input frame is not modified: the per-application traffic is built as one NumPy block, users are
+    factorized once and every application is summed with a single bincount over the same codes.
     
     Args:
-    - dataframe (DataFrame): DataFrame containing session data with application traffic columns (e.g., 'Social Media DL (Bytes)', 'Google DL (Bytes)').
+    - dataframe (DataFrame): DataFrame containing session data with 'MSISDN/Number' and application traffic columns
+                             (e.g. 'Social Media DL (Bytes)', 'Social Media UL (Bytes)').
+    - applications (list): Application names to aggregate.
+    - top_n (int): Number of top users per application.
     
     Returns:
-    - DataFrame: Aggregated traffic for each user per application, and top 10 most engaged users per application.
+    - DataFrame: Top users per application ('Application', 'Rank', 'MSISDN/Number', 'Traffic (Bytes)').
+    - DataFrame: Wide table with one '<Application> Traffic (Bytes)' column per application and one row per user.
     """
-    
-    application_columns = [
-        'Social Media DL (Bytes)', 'Google DL (Bytes)', 'Youtube DL (Bytes)', 'Netflix DL (Bytes)', 'Gaming DL (Bytes)', 'Other DL (Bytes)'
-    ]
-    
-    # Calculate total traffic per application for each user
-    for app_col in application_columns:
-        dataframe[f'{app_col}_TotalTraffic'] = dataframe[app_col].fillna(0)
-    
-    # Aggregate total traffic per application
-    app_traffic_aggregate = dataframe.groupby('MSISDN/Number')[application_columns].sum().reset_index()
-    
-    # Derive the top 10 most engaged users per application
-    top_users_per_app = app_traffic_aggregate[application_columns].apply(lambda x: x.sort_values(ascending=False).head(10))
+    # A missing direction counts as zero traffic, as with fillna(0)
+    traffic = np.nan_to_num(dataframe[[f'{app} DL (Bytes)' for app in applications]].to_numpy(dtype='float64', copy=True), copy=False)
+    traffic += np.nan_to_num(dataframe[[f'{app} UL (Bytes)' for app in applications]].to_numpy(dtype='float64', copy=True), copy=False)
+
+    codes, users = pd.factorize(dataframe['MSISDN/Number'], sort=True)
+    present = codes >= 0
+    codes, traffic = codes[present], traffic[present]
+
+    traffic_columns = [f'{app} Traffic (Bytes)' for app in applications]
+    user_traffic = np.column_stack([np.bincount(codes, weights=traffic[:, i], minlength=len(users)) for i in range(len(applications))]) \
+        if len(applications) else np.empty((len(users), 0))
+    app_traffic_aggregate = pd.DataFrame(user_traffic, columns=traffic_columns)
+    app_traffic_aggregate.insert(0, 'MSISDN/Number', np.asarray(users))
+
+    # Derive the top users per application with a partial sort of each column. Every user tied with
+    # the kth largest stays a candidate, and ties go to the earlier row, like nlargest(keep='first')
+    top_users = []
+    k = min(top_n, len(users))
+    for i, app in enumerate(applications):
+        column = user_traffic[:, i]
+        if k:
+            candidates = np.flatnonzero(column >= np.partition(column, len(column) - k)[len(column) - k])
+            top = candidates[np.lexsort((candidates, -column[candidates]))][:k]
+        else:
+            top = np.empty(0, dtype=np.intp)
+        top_users.append(pd.DataFrame({
+            'Application': app,
+            'Rank': np.arange(1, len(top) + 1),
+            'MSISDN/Number': np.asarray(users)[top],
+            'Traffic (Bytes)': column[top]
+        }))
+    top_users_per_app = pd.concat(top_users, ignore_index=True) if top_users else pd.DataFrame(
+        columns=['Application', 'Rank', 'MSISDN/Number', 'Traffic (Bytes)'])
     
     return top_users_per_app, app_traffic_aggregate
 
@@ -184,11 +483,15 @@ def aggregate_experience_metrics(dataframe):
     Aggregate experience metrics per user.
     
     Args:
-    - dataframe (DataFrame): The dataframe containing session data including columns for TCP retransmissions, RTT, throughput, and handset type.
+    - dataframe (DataFrame or iterable of DataFrames): The dataframe containing session data including columns for TCP retransmissions, RTT, throughput, and handset type.
+                      An iterable of chunks is aggregated chunk by chunk, so peak memory is bounded by the chunk size.
     
     Returns:
     - DataFrame: Aggregated metrics per user.
     """
+    if not isinstance(dataframe, pd.DataFrame):
+        return _aggregate_experience_metrics_in_chunks(dataframe)
+
     # Compute the average TCP retransmission by summing both DL and UL TCP retransmissions and taking the average
     dataframe['Average TCP Retransmission'] = (dataframe['TCP DL Retrans. Vol (Bytes)'] + dataframe['TCP UL Retrans. Vol (Bytes)']) / 2
     
@@ -222,11 +525,168 @@ def aggregate_experience_metrics(dataframe):
         'Avg_Bearer_TP_UL': 'Avg Bearer TP UL (kbps)'
     })
     # Fill missing values in categorical columns with 'Unknown'
+    if isinstance(aggregated_dataframe['Handset Type'].dtype, pd.CategoricalDtype):
+        aggregated_dataframe['Handset Type'] = aggregated_dataframe['Handset Type'].astype(object)
     aggregated_dataframe['Handset Type'].fillna('Unknown', inplace=True)
     # aggregated_dataframe["Handset Type"].fillna(dataframe["Handset Type"].mode()[0], inplace=True)
 
     return aggregated_dataframe
 
+EXPERIENCE_MEAN_COLUMNS = [
+    'Average TCP Retransmission', 'Average RTT', 'Avg RTT DL (ms)', 'Avg RTT UL (ms)',
+    'TCP DL Retrans. Vol (Bytes)', 'TCP UL Retrans. Vol (Bytes)', 'Average Throughput',
+    'Avg Bearer TP DL (kbps)', 'Avg Bearer TP UL (kbps)'
+]
+
+def _aggregate_experience_metrics_in_chunks(chunks):
+    """
+    Chunked variant of `aggregate_experience_metrics`: per-user sums and non-null counts are
+    accumulated across chunks and divided at the end, which reproduces the per-user means.
+    """
+    sum_columns = [f'{col} Sum' for col in EXPERIENCE_MEAN_COLUMNS]
+    count_columns = [f'{col} Count' for col in EXPERIENCE_MEAN_COLUMNS]
+    agg_functions = {**{col: 'sum' for col in sum_columns + count_columns}, 'Handset Type': 'first'}
+
+    state = None
+    for chunk in _iter_chunks(chunks):
+        chunk = chunk.assign(**{
+            'Average TCP Retransmission': (chunk['TCP DL Retrans. Vol (Bytes)'] + chunk['TCP UL Retrans. Vol (Bytes)']) / 2,
+            'Average RTT': (chunk['Avg RTT DL (ms)'] + chunk['Avg RTT UL (ms)']) / 2,
+            'Average Throughput': (chunk['Avg Bearer TP DL (kbps)'] + chunk['Avg Bearer TP UL (kbps)']) / 2
+        })
+        grouped = chunk.groupby('MSISDN/Number')
+        sums = grouped[EXPERIENCE_MEAN_COLUMNS].sum()
+        sums.columns = sum_columns
+        counts = grouped[EXPERIENCE_MEAN_COLUMNS].count()
+        counts.columns = count_columns
+        partial = pd.concat([sums, counts, grouped[['Handset Type']].first()], axis=1)
+        state = _combine_partials(state, partial, agg_functions)
+
+    if state is None:
+        state = pd.DataFrame(columns=list(agg_functions)).rename_axis('MSISDN/Number')
+
+    aggregated_dataframe = pd.DataFrame(index=state.index)
+    for col, sum_col, count_col in zip(EXPERIENCE_MEAN_COLUMNS, sum_columns, count_columns):
+        aggregated_dataframe[col] = state[sum_col] / state[count_col].where(state[count_col] > 0)
+    aggregated_dataframe.insert(6, 'Handset Type', state['Handset Type'].astype(object).fillna('Unknown'))
+
+    return aggregated_dataframe.reset_index()
+
+ENGAGEMENT_FEATURES = ['Session Frequency', 'Total Session Duration', 'Total Traffic']
+EXPERIENCE_FEATURES = ['Average TCP Retransmission', 'Average RTT', 'Average Throughput']
+ENGAGEMENT_COLUMNS = ['MSISDN/Number', 'Session Frequency', 'Total Session Duration', 'Total DL (Bytes)', 'Total UL (Bytes)', 'Total Traffic']
+EXPERIENCE_COLUMNS = [
+    'MSISDN/Number', 'Average TCP Retransmission', 'Average RTT', 'Avg RTT DL (ms)', 'Avg RTT UL (ms)',
+    'TCP DL Retrans. Vol (Bytes)', 'TCP UL Retrans. Vol (Bytes)', 'Handset Type', 'Average Throughput',
+    'Avg Bearer TP DL (kbps)', 'Avg Bearer TP UL (kbps)'
+]
+
+# Session columns read by the engagement and experience aggregations
+ENGAGEMENT_SOURCE_COLUMNS = ['MSISDN/Number', 'Dur. (ms)', 'Total DL (Bytes)', 'Total UL (Bytes)']
+EXPERIENCE_SOURCE_COLUMNS = [
+    'MSISDN/Number', 'Handset Type', 'Avg RTT DL (ms)', 'Avg RTT UL (ms)', 'TCP DL Retrans. Vol (Bytes)',
+    'TCP UL Retrans. Vol (Bytes)', 'Avg Bearer TP DL (kbps)', 'Avg Bearer TP UL (kbps)'
+]
+
+def aggregate_user_metrics_in_sql(table_name="xdr_data"):
+    """
+    Computes the engagement and experience tables with a single SQL GROUP BY, so only the
+    per-user rows are transferred instead of the full session table (PostgreSQL only).
+
+    Semantics follow the pandas path: sessions without MSISDN are dropped, sums of all-missing
+    values are 0, averages skip missing values and 'Handset Type' is the first non-null value in
+    table order (or 'Unknown').
+
+    Args:
+    - table_name (str): Session table to aggregate.
+
+    Returns:
+    - Tuple: (engagement_metrics, experience_metrics) DataFrames.
+    """
+    query = f"""
+                SELECT
+                    "MSISDN/Number",
+                    COUNT("Dur. (ms)") AS "Session Frequency",
+                    COALESCE(SUM("Dur. (ms)"), 0) AS "Total Session Duration",
+                    COALESCE(SUM("Total DL (Bytes)"), 0) AS "Total DL (Bytes)",
+                    COALESCE(SUM("Total UL (Bytes)"), 0) AS "Total UL (Bytes)",
+                    AVG(("TCP DL Retrans. Vol (Bytes)" + "TCP UL Retrans. Vol (Bytes)") / 2) AS "Average TCP Retransmission",
+                    AVG(("Avg RTT DL (ms)" + "Avg RTT UL (ms)") / 2) AS "Average RTT",
+                    AVG("Avg RTT DL (ms)") AS "Avg RTT DL (ms)",
+                    AVG("Avg RTT UL (ms)") AS "Avg RTT UL (ms)",
+                    AVG("TCP DL Retrans. Vol (Bytes)") AS "TCP DL Retrans. Vol (Bytes)",
+                    AVG("TCP UL Retrans. Vol (Bytes)") AS "TCP UL Retrans. Vol (Bytes)",
+                    COALESCE(
+                        (ARRAY_AGG("Handset Type" ORDER BY ctid) FILTER (WHERE "Handset Type" IS NOT NULL))[1],
+                        'Unknown'
+                    ) AS "Handset Type",
+                    AVG(("Avg Bearer TP DL (kbps)" + "Avg Bearer TP UL (kbps)") / 2) AS "Average Throughput",
+                    AVG("Avg Bearer TP DL (kbps)") AS "Avg Bearer TP DL (kbps)",
+                    AVG("Avg Bearer TP UL (kbps)") AS "Avg Bearer TP UL (kbps)"
+                FROM "{table_name}"
+                WHERE "MSISDN/Number" IS NOT NULL
+                GROUP BY "MSISDN/Number"
+                ORDER BY "MSISDN/Number";
+            """
+    user_metrics = execute_queries(query)
+    user_metrics['Total Traffic'] = user_metrics['Total DL (Bytes)'] + user_metrics['Total UL (Bytes)']
+
+    return user_metrics[ENGAGEMENT_COLUMNS], user_metrics[EXPERIENCE_COLUMNS]
+
+def aggregate_user_metrics(table_name="xdr_data", backend="sql", chunk_size=100_000):
+    """
+    Produces the engagement and experience tables for a session table.
+
+    Args:
+    - table_name (str): Session table to aggregate.
+    - backend (str): 'sql' to push the aggregation down into the database, or 'pandas' to stream
+                     the sessions and aggregate them client-side. 'sql' falls back to 'pandas' on error.
+    - chunk_size (int): Rows per chunk for the pandas backend.
+
+    Returns:
+    - Tuple: (engagement_metrics, experience_metrics) DataFrames.
+    """
+    if backend == "sql":
+        try:
+            return aggregate_user_metrics_in_sql(table_name)
+        except Exception as e:
+            print(f"SQL aggregation failed, falling back to pandas: {e}")
+    elif backend != "pandas":
+        raise ValueError("Invalid backend. Use 'sql' or 'pandas'.")
+
+    engagement_metrics = aggregate_engagement_metrics(
+        stream_data_from_postgres_db(table_name, columns=ENGAGEMENT_SOURCE_COLUMNS, chunk_size=chunk_size)
+    )
+    experience_metrics = aggregate_experience_metrics(
+        stream_data_from_postgres_db(table_name, columns=EXPERIENCE_SOURCE_COLUMNS, chunk_size=chunk_size)
+    )
+    return engagement_metrics, experience_metrics
+
+def compare_aggregations(left, right, key='MSISDN/Number', rtol=1e-9):
+    """
+    Parity check between two per-user tables (e.g. the SQL and pandas backends).
+
+    Args:
+    - left (DataFrame): First table.
+    - right (DataFrame): Second table with the same columns.
+    - key (str): User identifier column.
+    - rtol (float): Relative tolerance for numeric columns.
+
+    Returns:
+    - DataFrame: Number of mismatching users per column (rows missing on either side count as mismatches).
+    """
+    merged = left.merge(right, on=key, how='outer', suffixes=(' Left', ' Right'), indicator=True)
+    unmatched = int((merged['_merge'] != 'both').sum())
+    mismatches = {}
+    for col in left.columns.drop(key):
+        a, b = merged[f'{col} Left'], merged[f'{col} Right']
+        if pd.api.types.is_numeric_dtype(a) and pd.api.types.is_numeric_dtype(b):
+            equal = np.isclose(a.astype('float64'), b.astype('float64'), rtol=rtol, equal_nan=True)
+        else:
+            equal = (a == b) | (a.isna() & b.isna())
+        mismatches[col] = int((~np.asarray(equal)).sum())
+    return pd.DataFrame({'Column': list(mismatches), 'Mismatches': list(mismatches.values()), 'Unmatched Users': unmatched})
+
 def compute_distance_to_centroid(dataframe, features, centroid):
     """
     Compute the Euclidean distance from each data point to the centroid.
@@ -234,14 +694,113 @@ def compute_distance_to_centroid(dataframe, features, centroid):
     distances = np.sqrt(((dataframe[features] - centroid) ** 2).sum(axis=1))
     return distances
 
+def _centroid_matrix(centroids, features):
+    """
+    Returns centroids as a float64 array with columns in feature order.
+    """
+    if isinstance(centroids, (pd.Series, pd.DataFrame)):
+        centroids = centroids[features] if isinstance(centroids, pd.DataFrame) else centroids.reindex(features)
+    return np.asarray(centroids, dtype=np.float64)
+
+def centroid_distances(features, centroids, batch_size=1_000_000, dtype=np.float32):
+    """
+    Euclidean distances from every row to every centroid using ||x||² − 2x·c + ||c||² (one BLAS
+    matrix product per batch of rows). Rows and centroids are first shifted by the centroids' mean,
+    which leaves distances unchanged but limits cancellation on large-valued features.
+
+    Args:
+    - features (array-like): (n_users, n_features) feature matrix.
+    - centroids (array-like): One centroid (n_features,) or several (n_centroids, n_features).
+    - batch_size (int): Rows processed per matrix product.
+    - dtype (type): Output dtype.
+
+    Returns:
+    - np.ndarray: (n_users,) distances for a single centroid, else (n_users, n_centroids).
+      Rows with a missing (NaN) feature get NaN distances; fill missing features before scoring.
+    """
+    features = np.asarray(features, dtype=np.float64)
+    centroids = np.asarray(centroids, dtype=np.float64)
+    single = centroids.ndim == 1
+    centroids = np.atleast_2d(centroids)
+
+    shift = centroids.mean(axis=0)
+    centroids = centroids - shift
+    centroid_norms = np.einsum('ij,ij->i', centroids, centroids)
+
+    distances = np.empty((len(features), len(centroids)), dtype=dtype)
+    for start in range(0, len(features), batch_size):
+        batch = features[start:start + batch_size] - shift
+        squared = batch @ (-2 * centroids.T)
+        squared += np.einsum('ij,ij->i', batch, batch)[:, np.newaxis]
+        squared += centroid_norms
+        np.maximum(squared, 0, out=squared)
+        distances[start:start + batch_size] = np.sqrt(squared)
+
+    return distances[:, 0] if single else distances
+
+def align_user_index(left_keys, right_keys):
+    """
+    Inner-joins two user key arrays once, keeping the order of the left keys (like `merge(how='inner')`).
+    The right keys must be unique (one row per user).
+
+    Returns:
+    - np.ndarray: Shared user keys.
+    - np.ndarray: Positions of those users in left_keys.
+    - np.ndarray: Positions of those users in right_keys.
+    """
+    right_index = pd.Index(right_keys)
+    if not right_index.is_unique:
+        duplicates = right_index[right_index.duplicated()].unique()
+        raise ValueError(f"User keys must be unique; {len(duplicates)} duplicated, e.g. {list(duplicates[:5])}. "
+                         "Aggregate to one row per user first.")
+    right_positions = right_index.get_indexer(left_keys)
+    left_positions = np.flatnonzero(right_positions >= 0)
+    return np.asarray(left_keys)[left_positions], left_positions, right_positions[left_positions]
+
+def batch_scores(df_engagement, df_experience, engagement_centroids, experience_centroids, engagement_features, experience_features,
+                 key="MSISDN/Number", batch_size=1_000_000, dtype=np.float32):
+    """
+    Computes engagement, experience and satisfaction scores for all users without modifying the inputs.
+
+    Users are aligned by key once and distances are computed with `centroid_distances`, so several
+    centroids can be scored at a time. Users with a missing feature get NaN scores.
+
+    Args:
+    - df_engagement (DataFrame): Per-user engagement features.
+    - df_experience (DataFrame): Per-user experience features.
+    - engagement_centroids, experience_centroids: One centroid (Series or 1-D array) or several (DataFrame or 2-D array).
+    - engagement_features, experience_features (list): Feature columns matching the centroids.
+    - key (str): User identifier column.
+    - batch_size (int): Rows per matrix product.
+    - dtype (type): Dtype of the score arrays.
+
+    Returns:
+    - dict: key -> user ids, 'Engagement Score' and 'Experience Score' -> distances ((n,) or (n, n_centroids)),
+            and 'Satisfaction Score' -> their mean when both have the same shape.
+    """
+    user_ids, engagement_rows, experience_rows = align_user_index(df_engagement[key].to_numpy(), df_experience[key].to_numpy())
+
+    engagement_scores = centroid_distances(df_engagement[engagement_features].to_numpy()[engagement_rows],
+                                           _centroid_matrix(engagement_centroids, engagement_features), batch_size, dtype)
+    experience_scores = centroid_distances(df_experience[experience_features].to_numpy()[experience_rows],
+                                           _centroid_matrix(experience_centroids, experience_features), batch_size, dtype)
+
+    scores = {key: user_ids, 'Engagement Score': engagement_scores, 'Experience Score': experience_scores}
+    if engagement_scores.shape == experience_scores.shape:
+        scores['Satisfaction Score'] = ((engagement_scores + experience_scores) / 2).astype(dtype, copy=False)
+    return scores
+
 # Compute Engagement and Experience Scores
 def compute_scores(df_engagement, df_experience, engagement_centroid, experience_centroid, engagement_features, experience_features):
-    df_engagement["Engagement Score"] = compute_distance_to_centroid(df_engagement, engagement_features, engagement_centroid)
-    df_experience["Experience Score"] = compute_distance_to_centroid(df_experience, experience_features, experience_centroid)
-    
-    df_scores = df_engagement[["MSISDN/Number", "Engagement Score"]].merge(
-        df_experience[["MSISDN/Number", "Experience Score"]], on="MSISDN/Number"
-    )
+    df_engagement["Engagement Score"] = centroid_distances(df_engagement[engagement_features], _centroid_matrix(engagement_centroid, engagement_features), dtype=np.float64)
+    df_experience["Experience Score"] = centroid_distances(df_experience[experience_features], _centroid_matrix(experience_centroid, experience_features), dtype=np.float64)
+    
+    user_ids, engagement_rows, experience_rows = align_user_index(df_engagement["MSISDN/Number"].to_numpy(), df_experience["MSISDN/Number"].to_numpy())
+    df_scores = pd.DataFrame({
+        "MSISDN/Number": user_ids,
+        "Engagement Score": df_engagement["Engagement Score"].to_numpy()[engagement_rows],
+        "Experience Score": df_experience["Experience Score"].to_numpy()[experience_rows]
+    })
     
     df_scores["Satisfaction Score"] = df_scores[["Engagement Score", "Experience Score"]].mean(axis=1)
     return df_scores
@@ -276,9 +835,32 @@ def find_centroid(centroids, features, method="min"):
         raise TypeError("Centroids must be either a pandas DataFrame or a NumPy array.")
     return centroid, cluster
 
+def cluster_users(dataframe, features, n_clusters=3, backend='sampled', random_state=42):
+    """
+    Clusters z-scored copies of the features; missing averages are filled with the column mean.
+    """
+    selected = dataframe[['MSISDN/Number'] + features].copy()
+    selected[features] = selected[features].fillna(selected[features].mean())
+    selected = normalize_features(selected, features, normalize_type='zscore')
+    return kmeans_clustering(selected, features, n_clusters=n_clusters, scaled=False, backend=backend, random_state=random_state)
+
+def worst_experience_centroid(centroids):
+    """
+    The centroid of the worst-experience cluster: highest retransmission and RTT and lowest throughput.
+
+    Throughput is better when higher, so its z-score is negated before the features are summed.
+    """
+    signed = centroids[EXPERIENCE_FEATURES].copy()
+    signed['Average Throughput'] = -signed['Average Throughput']
+    _, cluster = find_centroid(signed, EXPERIENCE_FEATURES, method="max")
+    return centroids.loc[cluster]
+
 # Get Top 10 Satisfied Customers
 def get_top_customers(df_scores, n=10):
-    return df_scores.nlargest(n, "Satisfaction Score")
+    top_k = TopKAccumulator(n, metrics=["Satisfaction Score"])
+    for chunk in _iter_chunks(df_scores):
+        top_k.update(chunk)
+    return top_k.result("Satisfaction Score")
 
 # Build Regression Model
 def train_regression_model(df_scores, feature_columns, target_column, model="linear"):
@@ -298,29 +880,3 @@ def train_regression_model(df_scores, feature_columns, target_column, model="lin
 # Aggregate Averages by Cluster
 def aggregate_cluster_averages(data):
     return data.groupby("Cluster").mean()
-
-def kmeans_clustering(dataframe, features, n_clusters=3, scaled=True):
-    """
-    Performs K-means clustering on the selected features.
-
-    Args:
-    - dataframe (DataFrame): The dataframe containing the features to cluster.
-    - features (list): List of column names to use for clustering.
-    - n_clusters (int): Number of clusters.
-
-    Returns:
-    - DataFrame: DataFrame with a new 'Cluster' column representing cluster assignments.
-    """
-    selected_features = dataframe[features]
-    if scaled:
-        scaler = StandardScaler()
-        selected_features = scaler.fit_transform(selected_features)
-
-    # Apply KMeans clustering
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-    dataframe['Cluster'] = kmeans.fit_predict(selected_features)
-    
-    # Cluster descriptions based on centroids
-    cluster_centroids = pd.DataFrame(kmeans.cluster_centers_, columns=features)
-
-    return dataframe, kmeans, cluster_centroids
\ No newline at end of file
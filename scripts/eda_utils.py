@@ -1,6 +1,8 @@
+import numpy as np
 import pandas as pd
 from sklearn.decomposition import PCA
 from sklearn.preprocessing import StandardScaler
+from scripts.quantile_sketch import KLLSketch
 
 def calculate_user_statistics(dataframe, imsi_col):
     
@@ -14,7 +16,7 @@ def calculate_user_statistics(dataframe, imsi_col):
         'Average Records Per User': avg_records_per_user
     }
 
-def segment_users(dataframe, column, num_deciles):
+def segment_users(dataframe, column, num_deciles, backend="exact", epsilon=0.01, sketch=None):
     """
     Segment users into deciles based on a given column.
 
@@ -22,12 +24,25 @@ def segment_users(dataframe, column, num_deciles):
     dataframe (pd.DataFrame): Input dataframe
     column (str): Column to segment users by
     num_deciles (int): Number of deciles to segment users into
+    backend (str): 'exact' (pd.qcut) or 'sketch' (decile edges from a KLL quantile sketch)
+    epsilon (float): Rank error of the sketch built when backend is 'sketch'
+    sketch (KLLSketch or None): Sketch of the column built beforehand (e.g. across chunks); implies the sketch backend
 
     Returns:
     pd.DataFrame: Dataframe with added decile column
     """
     decile_column = f'{column} Decile'
-    dataframe[decile_column] = pd.qcut(dataframe[column], num_deciles, labels=False)
+    if sketch is None and backend == "exact":
+        dataframe[decile_column] = pd.qcut(dataframe[column], num_deciles, labels=False)
+    elif sketch is not None or backend == "sketch":
+        if sketch is None:
+            sketch = KLLSketch(epsilon=epsilon).update(dataframe[column].to_numpy(dtype='float64', na_value=np.nan))
+        edges = sketch.quantile(np.linspace(0, 1, num_deciles + 1))
+        # Values outside the sketched range fall into the first or last decile
+        edges[0], edges[-1] = -np.inf, np.inf
+        dataframe[decile_column] = pd.cut(dataframe[column], edges, labels=False)
+    else:
+        raise ValueError("Invalid backend. Use 'exact' or 'sketch'.")
     return dataframe
 
 def compute_decile_summary(dataframe, decile_column, agg_columns, agg_functions):
@@ -50,6 +65,8 @@ def compute_decile_summary(dataframe, decile_column, agg_columns, agg_functions)
     # Perform the groupby + agg
     return dataframe.groupby(decile_column).agg(agg_dict).reset_index()
 
+MOMENT_FUNCTIONS = ['count', 'mean', 'var', 'std', 'min', 'max']
+
 def compute_dispersion_measures(dataframe, columns, functions):
     """
     Compute dispersion measures for a given dataframe.
@@ -62,6 +79,9 @@ def compute_dispersion_measures(dataframe, columns, functions):
     Returns:
     pd.DataFrame: Dataframe with dispersion measures
     """
+    # Moment-based measures come from a single pass instead of one scan per function
+    if all(isinstance(function, str) and function in MOMENT_FUNCTIONS for function in functions):
+        return DispersionAccumulator(columns=columns, sketch=False).update(dataframe).moments().loc[list(functions)]
     return dataframe[columns].agg(functions)
 
 def melt_dataframe(dataframe, app_columns):
@@ -86,8 +106,127 @@ def get_aggregate_dataframe(dataframe):
     ).reset_index().rename(columns=lambda x: x.replace(' ', '_').title())
 
 
-def get_dispersion_summary(dataframe):
+class DispersionAccumulator:
+    """
+    Single-pass, mergeable dispersion statistics of numerical columns.
+
+    Each batch updates per-column count, mean, M2 (sum of squared deviations), min and max in one
+    vectorized pass, combined with Chan's parallel update, and feeds KLL sketches for the median and
+    IQR. Accumulators built over different chunks or workers can be merged.
+
+    Parameters:
+    columns (list or None): Columns to summarize. Defaults to the numerical columns of the first chunk
+    epsilon (float): Rank error of the quantile sketches
+    sketch (bool): Also sketch quantiles (needed for the median and IQR)
+    batch_size (int): Rows processed at a time, which bounds the working memory
+    """
+
+    def __init__(self, columns=None, epsilon=0.01, sketch=True, batch_size=65_536):
+        self.columns = list(columns) if columns is not None else None
+        self.epsilon = epsilon
+        self.sketch = sketch
+        self.batch_size = batch_size
+        self.count = self.mean = self.m2 = self.min = self.max = None
+        self.sketches = None
+
+    def _initialize(self, columns):
+        self.columns = list(columns)
+        size = len(self.columns)
+        self.count = np.zeros(size)
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+        self.min = np.full(size, np.nan)
+        self.max = np.full(size, np.nan)
+        self.sketches = {col: KLLSketch(epsilon=self.epsilon) for col in self.columns} if self.sketch else None
+
+    def _combine(self, count, mean, m2, minimum, maximum):
+        total = self.count + count
+        delta = mean - self.mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weight = np.where(total > 0, count / total, 0)
+        self.mean = self.mean + delta * weight
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * weight
+        self.count = total
+        self.min = np.fmin(self.min, minimum)
+        self.max = np.fmax(self.max, maximum)
+
+    def update(self, data):
+        """
+        Folds a dataframe (or an iterable of chunks) into the statistics.
+
+        Returns:
+        DispersionAccumulator: self, to allow chaining
+        """
+        chunks = [data] if isinstance(data, pd.DataFrame) else data
+        for chunk in chunks:
+            if self.count is None:
+                self._initialize(self.columns if self.columns is not None else chunk.select_dtypes(include='number').columns)
+            numeric_chunk = chunk[self.columns]
+            for start in range(0, len(chunk), self.batch_size):
+                block = numeric_chunk.iloc[start:start + self.batch_size].to_numpy(dtype='float64', na_value=np.nan)
+                present = ~np.isnan(block)
+                count = present.sum(axis=0)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    mean = np.where(present, block, 0).sum(axis=0) / count
+                deviations = np.where(present, block - mean, 0)
+                m2 = np.einsum('ij,ij->j', deviations, deviations)
+                self._combine(count, np.nan_to_num(mean), m2, np.fmin.reduce(block, axis=0), np.fmax.reduce(block, axis=0))
+                if self.sketches is not None:
+                    for i, col in enumerate(self.columns):
+                        self.sketches[col].update(block[:, i])
+        return self
+
+    def merge(self, other):
+        """
+        Merges an accumulator built over another part of the data.
+        """
+        if other.count is None:
+            return self
+        if self.count is None:
+            self._initialize(other.columns)
+        self._combine(other.count, other.mean, other.m2, other.min, other.max)
+        if self.sketches is not None and other.sketches is not None:
+            for col in self.columns:
+                self.sketches[col].merge(other.sketches[col])
+        return self
+
+    def moments(self):
+        """
+        Returns count, mean, var, std, min and max (rows) per column, as `DataFrame.agg` would.
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(self.count > 0, self.mean, np.nan)
+            var = np.where(self.count > 1, self.m2 / (self.count - 1), np.nan)
+        return pd.DataFrame([self.count, mean, var, np.sqrt(var), self.min, self.max],
+                            index=MOMENT_FUNCTIONS, columns=self.columns)
+
+    def finalize(self):
+        """
+        Returns the table of `get_dispersion_summary` (Mean, Median, Range, Variance, Std Dev, IQR).
+        """
+        moments = self.moments()
+        if self.sketches is not None:
+            quantiles = np.array([self.sketches[col].quantile([0.25, 0.5, 0.75]) for col in self.columns]).reshape(len(self.columns), 3)
+        else:
+            quantiles = np.full((len(self.columns), 3), np.nan)
+        return pd.DataFrame({
+            'Mean': moments.loc['mean'],
+            'Median': quantiles[:, 1],
+            'Range': moments.loc['max'] - moments.loc['min'],
+            'Variance': moments.loc['var'],
+            'Std Dev': moments.loc['std'],
+            'IQR': quantiles[:, 2] - quantiles[:, 0]
+        }, index=pd.Index(self.columns))
+
+def get_dispersion_summary(dataframe, backend="sketch", epsilon=0.01):
     # Compute dispersion parameters for each quantitative variable
+    # backend='sketch' runs one pass of moment accumulators and KLL sketches (approximate median and IQR)
+    # and also accepts an iterable of chunks; backend='exact' computes every measure separately
+
+    if backend == "sketch":
+        return DispersionAccumulator(epsilon=epsilon).update(dataframe).finalize()
+    if backend != "exact":
+        raise ValueError("Invalid backend. Use 'exact' or 'sketch'.")
 
     numeric_dataframe = dataframe.select_dtypes(include='number')
 
@@ -161,10 +300,18 @@ def calculate_user_stats(dataframe):
         "Average Records Per User": avg_records_per_user
     }
 
-def identify_outliers(data, column, threshold=1.5):
-
-    q1 = data[column].quantile(0.25)
-    q3 = data[column].quantile(0.75)
+def identify_outliers(data, column, threshold=1.5, backend="exact", epsilon=0.01, sketch=None):
+    # backend='sketch' (or a prebuilt KLLSketch of the column) takes the quartiles from a quantile sketch
+
+    if sketch is None and backend == "exact":
+        q1 = data[column].quantile(0.25)
+        q3 = data[column].quantile(0.75)
+    elif sketch is not None or backend == "sketch":
+        if sketch is None:
+            sketch = KLLSketch(epsilon=epsilon).update(data[column].to_numpy(dtype='float64', na_value=np.nan))
+        q1, q3 = sketch.quantile([0.25, 0.75])
+    else:
+        raise ValueError("Invalid backend. Use 'exact' or 'sketch'.")
     iqr = q3 - q1
     return data[
         (data[column] < q1 - threshold * iqr) | (data[column] > q3 + threshold * iqr)
@@ -0,0 +1,119 @@
+import os
+import json
+import uuid
+import hashlib
+import argparse
+from datetime import datetime, timezone
+import pandas as pd
+from scripts.aggregation import (
+    ENGAGEMENT_FEATURES, ENGAGEMENT_SOURCE_COLUMNS, EXPERIENCE_FEATURES, EXPERIENCE_SOURCE_COLUMNS, aggregate_engagement_metrics,
+    aggregate_experience_metrics, aggregate_user_metrics, cluster_users, compute_scores, find_centroid, get_top_customers,
+    worst_experience_centroid
+)
+from scripts.sql_queries import get_table_version
+
+KPI_PATH = os.getenv("KPI_ARTIFACT_PATH", "data/kpis.json")
+
+def load_user_metrics(table_name="xdr_data", csv_path=None, backend="sql", chunk_size=100_000):
+    """
+    Builds the per-user engagement and experience tables from the database or a session CSV.
+
+    Returns:
+    - Tuple: (engagement_metrics, experience_metrics, source) where source describes the input.
+    """
+    if csv_path is not None:
+        engagement = aggregate_engagement_metrics(pd.read_csv(csv_path, usecols=ENGAGEMENT_SOURCE_COLUMNS, chunksize=chunk_size))
+        experience = aggregate_experience_metrics(pd.read_csv(csv_path, usecols=EXPERIENCE_SOURCE_COLUMNS, chunksize=chunk_size))
+        stat = os.stat(csv_path)
+        return engagement, experience, {'csv': csv_path, 'version': f"{stat.st_size}-{stat.st_mtime_ns}"}
+
+    engagement, experience = aggregate_user_metrics(table_name, backend=backend, chunk_size=chunk_size)
+    return engagement, experience, {'table': table_name, 'version': get_table_version(table_name)}
+
+def compute_kpis(df_engagement, df_experience, n_clusters=3, backend='sampled', top_n=10, random_state=42):
+    """
+    Runs clustering and scoring on the per-user tables and condenses the results into headline KPIs.
+
+    The engagement score is the distance to the least engaged cluster and the experience score the
+    distance to the worst-experience cluster (see `worst_experience_centroid`).
+
+    Returns:
+    - dict: JSON-serializable KPIs.
+    """
+    engagement, _, engagement_centroids = cluster_users(df_engagement, ENGAGEMENT_FEATURES, n_clusters, backend, random_state)
+    experience, _, experience_centroids = cluster_users(df_experience, EXPERIENCE_FEATURES, n_clusters, backend, random_state)
+    engagement_centroid, _ = find_centroid(engagement_centroids, ENGAGEMENT_FEATURES, method="min")
+    experience_centroid = worst_experience_centroid(experience_centroids)
+
+    scores = compute_scores(engagement, experience, engagement_centroid, experience_centroid, ENGAGEMENT_FEATURES, EXPERIENCE_FEATURES)
+    top_customers = get_top_customers(scores, top_n)
+
+    return {
+        'total_users': int(scores['MSISDN/Number'].nunique()),
+        'total_sessions': int(df_engagement['Session Frequency'].sum()),
+        'total_traffic_bytes': float(df_engagement['Total Traffic'].sum()),
+        'engagement_clusters': int(engagement['Cluster'].nunique()),
+        'experience_clusters': int(experience['Cluster'].nunique()),
+        'engagement_cluster_sizes': {str(k): int(v) for k, v in engagement['Cluster'].value_counts().sort_index().items()},
+        'experience_cluster_sizes': {str(k): int(v) for k, v in experience['Cluster'].value_counts().sort_index().items()},
+        'engagement_score_range': [float(scores['Engagement Score'].min()), float(scores['Engagement Score'].max())],
+        'experience_score_range': [float(scores['Experience Score'].min()), float(scores['Experience Score'].max())],
+        'average_satisfaction_score': float(scores['Satisfaction Score'].mean()),
+        'top_satisfaction_score': float(scores['Satisfaction Score'].max()),
+        'top_customers': [
+            {'MSISDN/Number': int(row['MSISDN/Number']), 'Satisfaction Score': float(row['Satisfaction Score'])}
+            for _, row in top_customers.iterrows()
+        ]
+    }
+
+def write_kpis(kpis, source, parameters, path=KPI_PATH):
+    """
+    Writes the KPI artifact atomically, stamped with a version derived from its content.
+    """
+    content = {'kpis': kpis, 'source': source, 'parameters': parameters}
+    artifact = {
+        'version': hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()[:16],
+        'generated_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        **content
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temporary_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(temporary_path, "w") as file:
+        json.dump(artifact, file, indent=2, default=str)
+    os.replace(temporary_path, path)
+    return artifact
+
+def materialize_kpis(table_name="xdr_data", csv_path=None, path=KPI_PATH, aggregation_backend="sql", n_clusters=3,
+                     clustering_backend="sampled", chunk_size=100_000, random_state=42):
+    """
+    Batch job: aggregates the sessions, clusters and scores the users and writes the KPI artifact.
+
+    Args:
+    - table_name (str): Session table to read when csv_path is not given.
+    - csv_path (str or None): Session CSV to read instead of the database.
+    - path (str): Output JSON artifact.
+    - aggregation_backend (str): 'sql' or 'pandas' (see `aggregate_user_metrics`).
+    - n_clusters (int): Number of engagement and experience clusters.
+    - clustering_backend (str): Backend of `kmeans_clustering`.
+    - chunk_size (int): Rows per chunk when streaming sessions.
+    - random_state (int): Seed for clustering.
+
+    Returns:
+    - dict: The written artifact.
+    """
+    df_engagement, df_experience, source = load_user_metrics(table_name, csv_path, aggregation_backend, chunk_size)
+    kpis = compute_kpis(df_engagement, df_experience, n_clusters=n_clusters, backend=clustering_backend, random_state=random_state)
+    parameters = {'n_clusters': n_clusters, 'clustering_backend': clustering_backend, 'random_state': random_state}
+    artifact = write_kpis(kpis, source, parameters, path)
+    print(f"KPIs version {artifact['version']} written to {path}.")
+    return artifact
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Materialize the dashboard KPI artifact.")
+    parser.add_argument("--table", default="xdr_data", help="Session table to aggregate.")
+    parser.add_argument("--csv", default=None, help="Session CSV to aggregate instead of the database.")
+    parser.add_argument("--output", default=KPI_PATH)
+    parser.add_argument("--backend", default="sql", choices=["sql", "pandas"])
+    parser.add_argument("--clusters", type=int, default=3)
+    args = parser.parse_args()
+    materialize_kpis(args.table, args.csv, args.output, args.backend, args.clusters)
@@ -0,0 +1,452 @@
+import os
+import ast
+import json
+import time
+import uuid
+import shutil
+import joblib
+import hashlib
+import inspect
+import argparse
+import textwrap
+import functools
+import importlib.util
+import pandas as pd
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from scripts.aggregation import (
+    ENGAGEMENT_FEATURES, ENGAGEMENT_SOURCE_COLUMNS, EXPERIENCE_FEATURES, EXPERIENCE_SOURCE_COLUMNS, aggregate_engagement_metrics,
+    aggregate_experience_metrics, cluster_users, compute_scores, find_centroid, train_regression_model, worst_experience_centroid
+)
+from scripts.preprocessing.data_cleaning import clean_dataframe
+
+PIPELINE_DIR = os.getenv("XDR_PIPELINE_DIR", "data/pipeline")
+SOURCE_VERSION_FILE = ".source_version.json"
+
+ID_COLUMNS = ['Bearer Id', 'IMSI', 'MSISDN/Number', 'IMEI']
+
+@functools.lru_cache(maxsize=None)
+def _module_source(module_name):
+    """
+    Source of a module and the `scripts.*` modules it imports anywhere in its body (including
+    imports inside functions), read from disk without importing them.
+
+    Returns:
+    - tuple: (source, imported module names)
+    """
+    spec = importlib.util.find_spec(module_name)
+    if spec is None or spec.origin is None or not spec.origin.endswith(".py"):
+        return "", ()
+    with open(spec.origin, encoding="utf-8") as file:
+        source = file.read()
+    return source, tuple(sorted(_imported_modules(ast.parse(source))))
+
+def _imported_modules(tree):
+    imported = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imported.update(alias.name for alias in node.names if alias.name.startswith("scripts."))
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and _is_scripts_module(node.module or ""):
+            for alias in node.names:
+                # `from scripts.preprocessing import data_cleaning` imports a module, not a name
+                submodule = f"{node.module}.{alias.name}"
+                imported.add(submodule if _is_package(node.module) and importlib.util.find_spec(submodule) else node.module)
+    return imported
+
+def _is_scripts_module(module_name):
+    return module_name == "scripts" or module_name.startswith("scripts.")
+
+def _is_package(module_name):
+    spec = importlib.util.find_spec(module_name)
+    return spec is not None and spec.submodule_search_locations is not None
+
+def code_hashes(func):
+    """
+    Content hashes of a stage function and of every `scripts.*` module it reaches.
+
+    The modules are those whose functions, classes or submodules the function references, and
+    transitively everything they import, so editing e.g. `aggregate_engagement_metrics` changes
+    the hash of every stage that ends up calling it. Plain constants the function reads from its
+    module globals are hashed by value.
+
+    Returns:
+    - dict: 'function', 'constants' and one entry per module name.
+    """
+    source = inspect.getsource(func)
+    names, constants, pending = set(), {}, _imported_modules(ast.parse(textwrap.dedent(source)))
+    codes = [func.__code__]
+    while codes:
+        code = codes.pop()
+        names.update(code.co_names)
+        codes.extend(const for const in code.co_consts if inspect.iscode(const))
+    for name in names:
+        if name not in func.__globals__:
+            continue
+        value = func.__globals__[name]
+        module = value.__name__ if inspect.ismodule(value) else getattr(value, "__module__", None)
+        if inspect.ismodule(value) or inspect.isfunction(value) or inspect.isclass(value):
+            if module and _is_scripts_module(module) and module != func.__module__:
+                pending.add(module)
+        elif isinstance(value, (str, int, float, bool, list, tuple, dict)):
+            constants[name] = value
+
+    hashes = {}
+    while pending:
+        module = pending.pop()
+        if module in hashes:
+            continue
+        module_source, imported = _module_source(module)
+        hashes[module] = hashlib.sha256(module_source.encode()).hexdigest()
+        pending.update(imported)
+    hashes['function'] = hashlib.sha256(source.encode()).hexdigest()
+    hashes['constants'] = hashlib.sha256(json.dumps(constants, sort_keys=True, default=str).encode()).hexdigest()
+    return hashes
+
+class Stage:
+    """
+    One step of a pipeline.
+
+    Args:
+    - name (str): Unique stage name.
+    - func (callable): Module-level function called as func(*inputs, **params).
+    - inputs (tuple): Names of the upstream stages whose outputs are passed to func, in order.
+    - params (dict or None): Keyword arguments of func; part of the stage fingerprint.
+    - columns (dict or None): Upstream stage -> columns to read from its Parquet output.
+    - version (str, callable or None): Extra fingerprint input, e.g. a content hash of the source data.
+      A callable is resolved each time the pipeline computes its fingerprints.
+    """
+
+    def __init__(self, name, func, inputs=(), params=None, columns=None, version=None):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.params = params or {}
+        self.columns = columns or {}
+        self.version = version
+
+    def resolve_version(self):
+        return self.version() if callable(self.version) else self.version
+
+    def fingerprint(self, input_fingerprints, version):
+        """
+        Hashes the stage code (see `code_hashes`), parameters, column projections, version and upstream fingerprints.
+
+        Args:
+        - input_fingerprints (dict): Fingerprints of the upstream stages.
+        - version (str or None): The resolved stage version (see `Pipeline._resolve_version`).
+        """
+        payload = {
+            'name': self.name,
+            'code': code_hashes(self.func),
+            'params': self.params,
+            'columns': self.columns,
+            'version': version,
+            'inputs': [input_fingerprints[name] for name in self.inputs]
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+def _output_path(store_dir, stage_name, fingerprint):
+    return os.path.join(store_dir, stage_name, fingerprint)
+
+def _find_output(path):
+    """
+    Returns the persisted output of a stage (Parquet file, directory of Parquet files or joblib file), if any.
+    """
+    for candidate in (f"{path}.parquet", path, f"{path}.joblib"):
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+def _save_output(output, path):
+    """
+    Persists a DataFrame as Parquet, a dict of DataFrames as a directory of Parquet files and
+    anything else with joblib. Files are written under a temporary name and renamed when complete.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    if isinstance(output, pd.DataFrame):
+        output.to_parquet(temporary_path)
+        final_path = f"{path}.parquet"
+    elif isinstance(output, dict) and output and all(isinstance(value, pd.DataFrame) for value in output.values()):
+        os.makedirs(temporary_path)
+        for key, frame in output.items():
+            frame.to_parquet(os.path.join(temporary_path, f"{key}.parquet"))
+        final_path = path
+    else:
+        joblib.dump(output, temporary_path)
+        final_path = f"{path}.joblib"
+    if os.path.isdir(final_path):
+        shutil.rmtree(final_path)
+    os.replace(temporary_path, final_path)
+    return final_path
+
+def _load_output(path, columns=None):
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path, columns=columns)
+    if path.endswith(".joblib"):
+        return joblib.load(path)
+    return {file_name[:-len(".parquet")]: pd.read_parquet(os.path.join(path, file_name))
+            for file_name in sorted(os.listdir(path)) if file_name.endswith(".parquet")}
+
+def _execute(stage, input_paths, output_path):
+    """
+    Runs one stage: loads its inputs from disk, calls it and persists its output (also used in worker processes).
+    """
+    started = time.perf_counter()
+    inputs = [_load_output(input_paths[name], stage.columns.get(name)) for name in stage.inputs]
+    output = stage.func(*inputs, **stage.params)
+    _save_output(output, output_path)
+    return time.perf_counter() - started
+
+class Pipeline:
+    """
+    A DAG of stages whose outputs are cached on disk by fingerprint.
+
+    A stage's fingerprint covers its code (the stage function plus the source of every `scripts.*`
+    module it reaches, see `code_hashes`), parameters and the fingerprints of its inputs, so a
+    change anywhere invalidates exactly the stages downstream of it; unchanged stages are loaded
+    from their persisted output instead of being recomputed. Independent stages (e.g. the
+    engagement and experience branches) run in parallel worker processes.
+
+    Args:
+    - stages (list of Stage): Stages in any order; inputs must name other stages.
+    - store_dir (str): Directory of the persisted stage outputs.
+    """
+
+    def __init__(self, stages, store_dir=PIPELINE_DIR):
+        self.stages = {stage.name: stage for stage in stages}
+        self.store_dir = store_dir
+        for stage in stages:
+            unknown = [name for name in stage.inputs if name not in self.stages]
+            if unknown:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown stage(s): {', '.join(unknown)}.")
+        self.order = self._topological_order()
+
+    def _topological_order(self):
+        order, visiting, done = [], set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Cycle detected at stage '{name}'.")
+            visiting.add(name)
+            for upstream in self.stages[name].inputs:
+                visit(upstream)
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def _resolve_version(self, stage):
+        """
+        Resolves a stage's version and records it next to the stage outputs. If a version callable
+        fails (e.g. the database is unreachable), the last recorded version is used instead, so the
+        stage keeps matching its cached output.
+        """
+        if not callable(stage.version):
+            return stage.version
+        path = os.path.join(self.store_dir, stage.name, SOURCE_VERSION_FILE)
+        try:
+            version = stage.resolve_version()
+        except Exception as e:
+            if not os.path.exists(path):
+                raise RuntimeError(f"Cannot resolve the source version of stage '{stage.name}' and none was recorded.") from e
+            with open(path) as file:
+                version = json.load(file)['version']
+            print(f"Cannot resolve the source version of stage '{stage.name}' ({e}), using the last recorded version.")
+            return version
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(temporary_path, "w") as file:
+            json.dump({'version': version}, file, default=str)
+        os.replace(temporary_path, path)
+        return version
+
+    def fingerprints(self):
+        fingerprints = {}
+        for name in self.order:
+            stage = self.stages[name]
+            fingerprints[name] = stage.fingerprint(fingerprints, version=self._resolve_version(stage))
+        return fingerprints
+
+    def _required(self, targets):
+        required = set()
+        pending = list(targets)
+        while pending:
+            name = pending.pop()
+            if name not in required:
+                required.add(name)
+                pending.extend(self.stages[name].inputs)
+        return [name for name in self.order if name in required]
+
+    def run(self, targets=None, parallel=True, max_workers=2, force=()):
+        """
+        Brings the target stages up to date, running only stages whose output is missing.
+
+        Args:
+        - targets (list or None): Stages to produce. Defaults to every stage.
+        - parallel (bool): Run independent stages in separate processes.
+        - max_workers (int): Number of worker processes.
+        - force (tuple): Stages to recompute even if their output exists.
+
+        Returns:
+        - pd.DataFrame: One row per stage with its fingerprint, status ('cached' or 'ran') and run time.
+        """
+        fingerprints = self.fingerprints()
+        names = self._required(targets if targets is not None else list(self.stages))
+        paths, report = {}, {}
+
+        for name in names:
+            path = _find_output(_output_path(self.store_dir, name, fingerprints[name]))
+            if path is not None and name not in force:
+                paths[name] = path
+                report[name] = {'Stage': name, 'Fingerprint': fingerprints[name], 'Status': 'cached', 'Seconds': 0.0}
+
+        pending = [name for name in names if name not in paths]
+        executor = ProcessPoolExecutor(max_workers=max_workers) if parallel and len(pending) > 1 else None
+        running = {}
+        try:
+            while pending or running:
+                ready = [name for name in pending if all(upstream in paths for upstream in self.stages[name].inputs)]
+                for name in ready:
+                    pending.remove(name)
+                    stage = self.stages[name]
+                    output_path = _output_path(self.store_dir, name, fingerprints[name])
+                    input_paths = {upstream: paths[upstream] for upstream in stage.inputs}
+                    if executor is None:
+                        seconds = _execute(stage, input_paths, output_path)
+                        paths[name] = _find_output(output_path)
+                        report[name] = {'Stage': name, 'Fingerprint': fingerprints[name], 'Status': 'ran', 'Seconds': seconds}
+                    else:
+                        running[executor.submit(_execute, stage, input_paths, output_path)] = name
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    seconds = future.result()
+                    paths[name] = _find_output(_output_path(self.store_dir, name, fingerprints[name]))
+                    report[name] = {'Stage': name, 'Fingerprint': fingerprints[name], 'Status': 'ran', 'Seconds': seconds}
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        return pd.DataFrame([report[name] for name in names])
+
+    def load(self, name, columns=None):
+        """
+        Loads the persisted output of a stage for the current fingerprints.
+        """
+        path = _find_output(_output_path(self.store_dir, name, self.fingerprints()[name]))
+        if path is None:
+            raise FileNotFoundError(f"Stage '{name}' has no output for its current inputs; run the pipeline first.")
+        return _load_output(path, columns)
+
+    def prune(self):
+        """
+        Removes persisted outputs that no longer match a current fingerprint.
+        """
+        fingerprints = self.fingerprints()
+        for name in self.stages:
+            stage_dir = os.path.join(self.store_dir, name)
+            if not os.path.isdir(stage_dir):
+                continue
+            for entry in os.listdir(stage_dir):
+                if entry != SOURCE_VERSION_FILE and entry.split(".")[0] != fingerprints[name]:
+                    path = os.path.join(stage_dir, entry)
+                    shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+
+def file_content_hash(path, block_size=1 << 20):
+    """
+    SHA-256 of a file's content.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def table_version(table_name):
+    from scripts.sql_queries import get_table_version
+    return get_table_version(table_name)
+
+# Stage functions (module level so worker processes can unpickle them)
+
+def load_sessions(csv_path=None, table_name="xdr_data"):
+    if csv_path is not None:
+        return pd.read_csv(csv_path)
+    from scripts.preprocessing.data_cache import load_cached_table
+    return load_cached_table(table_name)
+
+def clean_sessions(sessions, outlier_method="IQR", outlier_threshold=1.5):
+    # Duplicates are dropped with the identifiers in place, so identical sessions of different users
+    # both survive; the identifiers are then set aside so they are neither imputed nor treated as outliers
+    sessions = sessions.dropna(subset=['MSISDN/Number']).drop_duplicates()
+    ids = [col for col in ID_COLUMNS if col in sessions.columns]
+    cleaned = clean_dataframe(sessions.drop(columns=ids), outlier_method=outlier_method, outlier_threshold=outlier_threshold,
+                              drop_duplicates=False)
+    return sessions[ids].loc[cleaned.index].join(cleaned).reset_index(drop=True)
+
+def engagement_metrics(sessions):
+    return aggregate_engagement_metrics(sessions)
+
+def experience_metrics(sessions):
+    return aggregate_experience_metrics(sessions)
+
+def cluster_metrics(metrics, features, n_clusters=3, backend="sampled", random_state=42):
+    clusters, _, centroids = cluster_users(metrics, features, n_clusters=n_clusters, backend=backend, random_state=random_state)
+    return {'clusters': clusters, 'centroids': centroids}
+
+def satisfaction_scores(engagement_clusters, experience_clusters):
+    engagement_centroid, _ = find_centroid(engagement_clusters['centroids'], ENGAGEMENT_FEATURES, method="min")
+    experience_centroid = worst_experience_centroid(experience_clusters['centroids'])
+    return compute_scores(engagement_clusters['clusters'], experience_clusters['clusters'], engagement_centroid,
+                          experience_centroid, ENGAGEMENT_FEATURES, EXPERIENCE_FEATURES)
+
+def satisfaction_model(scores, model="linear"):
+    return train_regression_model(scores, ['Engagement Score', 'Experience Score'], 'Satisfaction Score', model=model)
+
+def build_pipeline(csv_path=None, table_name="xdr_data", n_clusters=3, clustering_backend="sampled", outlier_method="IQR",
+                   outlier_threshold=1.5, regression_model="linear", store_dir=PIPELINE_DIR):
+    """
+    Declares load -> clean -> engagement / experience (parallel branches) -> clustering -> scores -> regression.
+
+    The load stage is versioned by the content hash of the CSV, or by the table version stamp.
+    The version is resolved when fingerprints are computed, not here, so building the pipeline
+    never needs the database.
+
+    Returns:
+    - Pipeline: The pipeline.
+    """
+    if csv_path is not None:
+        source_version = functools.partial(file_content_hash, csv_path)
+    else:
+        source_version = functools.partial(table_version, table_name)
+
+    clustering = {'n_clusters': n_clusters, 'backend': clustering_backend}
+    return Pipeline([
+        Stage("sessions", load_sessions, params={'csv_path': csv_path, 'table_name': table_name}, version=source_version),
+        Stage("clean", clean_sessions, ["sessions"], {'outlier_method': outlier_method, 'outlier_threshold': outlier_threshold}),
+        Stage("engagement", engagement_metrics, ["clean"], columns={"clean": ENGAGEMENT_SOURCE_COLUMNS}),
+        Stage("experience", experience_metrics, ["clean"], columns={"clean": EXPERIENCE_SOURCE_COLUMNS}),
+        Stage("engagement_clusters", cluster_metrics, ["engagement"], {'features': ENGAGEMENT_FEATURES, **clustering}),
+        Stage("experience_clusters", cluster_metrics, ["experience"], {'features': EXPERIENCE_FEATURES, **clustering}),
+        Stage("scores", satisfaction_scores, ["engagement_clusters", "experience_clusters"]),
+        Stage("regression", satisfaction_model, ["scores"], {'model': regression_model}),
+    ], store_dir=store_dir)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the xDR analysis pipeline, reusing unchanged stage outputs.")
+    parser.add_argument("--csv", default=None, help="Session CSV to read instead of the database.")
+    parser.add_argument("--table", default="xdr_data")
+    parser.add_argument("--clusters", type=int, default=3)
+    parser.add_argument("--store", default=PIPELINE_DIR)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--force", nargs="*", default=(), help="Stages to recompute.")
+    args = parser.parse_args()
+    pipeline = build_pipeline(args.csv, args.table, args.clusters, store_dir=args.store)
+    print(pipeline.run(max_workers=args.workers, force=tuple(args.force)).to_string(index=False))
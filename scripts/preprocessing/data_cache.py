@@ -0,0 +1,230 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from scripts.preprocessing.data_loaders import load_data_from_postgres_db, stream_data_from_postgres_db
+
+CACHE_DIR = os.getenv("XDR_CACHE_DIR", "data/cache")
+FINGERPRINT_FILE = "_fingerprint.json"
+
+CATEGORICAL_COLUMNS = ['Handset Type', 'Handset Manufacturer', 'Last Location Name']
+
+INT32_MIN, INT32_MAX = np.iinfo(np.int32).min, np.iinfo(np.int32).max
+
+def get_table_fingerprint(table_name="xdr_data"):
+    """
+    Computes a cheap fingerprint of a database table (row count plus max 'End' timestamp).
+
+    Args:
+    - table_name (str): Name of the table to fingerprint.
+
+    Returns:
+    - dict or None: {'row_count': int, 'max_end': str} or None if the database is unreachable.
+    """
+    query = f'SELECT COUNT(*) AS "row_count", MAX("End") AS "max_end" FROM "{table_name}";'
+    result = load_data_from_postgres_db(query)
+    if result is None:
+        return None
+    return {
+        'row_count': int(result['row_count'].iloc[0]),
+        'max_end': None if pd.isna(result['max_end'].iloc[0]) else str(result['max_end'].iloc[0])
+    }
+
+def _read_fingerprint(table_dir):
+    path = os.path.join(table_dir, FINGERPRINT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+def is_cache_valid(table_name="xdr_data", fingerprint=None, cache_dir=CACHE_DIR):
+    """
+    Checks whether the Parquet cache of a table matches the given fingerprint.
+
+    Args:
+    - table_name (str): Name of the cached table.
+    - fingerprint (dict or None): Current table fingerprint. Computed from the database if None.
+    - cache_dir (str): Root directory of the cache.
+
+    Returns:
+    - bool: True if the cache exists and was built from the same table state.
+    """
+    if fingerprint is None:
+        fingerprint = get_table_fingerprint(table_name)
+    cached = _read_fingerprint(os.path.join(cache_dir, table_name))
+    return cached is not None and cached == fingerprint
+
+def invalidate_cache(table_name="xdr_data", cache_dir=CACHE_DIR):
+    """
+    Removes the Parquet cache of a table.
+    """
+    shutil.rmtree(os.path.join(cache_dir, table_name), ignore_errors=True)
+
+NUMERIC_STORAGE = ('int32', 'int64', 'float32', 'float64')
+
+def _widen(previous, needed, float32_exact):
+    """
+    Smallest storage type holding both the values already planned as `previous` and a chunk needing `needed`.
+
+    Types only ever widen (int32 -> int64 / float32 -> float64). Integers move to float32 only when
+    every value seen so far, earlier chunks included, round-trips exactly through float32.
+    """
+    if previous is None or previous == needed:
+        return needed
+    types = {previous, needed}
+    if 'float64' in types:
+        return 'float64'
+    if types == {'int32', 'int64'}:
+        return 'int64'
+    if types == {'int32', 'float32'} and float32_exact:
+        return 'float32'
+    return 'float64'
+
+def _update_dtype_plan(chunk, plan, float32_exact=None):
+    """
+    Widens the per-column storage type plan with the values of a new chunk.
+
+    A float column is stored as int32 only if every value seen so far is integral, non-null and
+    within int32 range, and as float32 only if every value round-trips exactly through float32.
+
+    Args:
+    - chunk (pd.DataFrame): The new chunk.
+    - plan (dict): Column -> storage type, updated in place.
+    - float32_exact (dict or None): Column -> whether every value seen so far round-trips through
+      float32, updated in place. Without it, earlier chunks are assumed not to.
+    """
+    if float32_exact is None:
+        float32_exact = {}
+    for col in chunk.columns:
+        series = chunk[col]
+        if col in CATEGORICAL_COLUMNS:
+            plan[col] = 'category'
+            continue
+        kind = series.dtype.kind
+        previous = plan.get(col)
+        if kind not in 'iuf' or (previous is not None and previous not in NUMERIC_STORAGE):
+            plan.setdefault(col, series.dtype)
+            continue
+
+        values = series.to_numpy(dtype='float64', na_value=np.nan)
+        present = values[~np.isnan(values)]
+        chunk_float32_exact = bool(np.all(present.astype('float32').astype('float64') == present))
+        float32_exact[col] = chunk_float32_exact and (previous is None or float32_exact.get(col, False))
+
+        if len(present) == len(values) and bool(np.all(present == np.floor(present))):
+            in_int32 = len(present) == 0 or (present.min() >= INT32_MIN and present.max() <= INT32_MAX)
+            needed = 'int32' if in_int32 else 'int64'
+        else:
+            needed = 'float32' if chunk_float32_exact else 'float64'
+        plan[col] = _widen(previous, needed, float32_exact[col])
+    return plan
+
+def _arrow_schema(plan):
+    """
+    Translates a dtype plan into the Arrow schema shared by every part file.
+    """
+    arrow_types = {
+        'category': pa.dictionary(pa.int32(), pa.string()),
+        'int32': pa.int32(),
+        'int64': pa.int64(),
+        'float32': pa.float32(),
+        'float64': pa.float64()
+    }
+    fields = []
+    for col, dtype in plan.items():
+        if isinstance(dtype, str):
+            arrow_type = arrow_types[dtype]
+        elif dtype.kind == 'M':
+            arrow_type = pa.timestamp('ns')
+        elif dtype.kind == 'b':
+            arrow_type = pa.bool_()
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(col, arrow_type))
+    return pa.schema(fields)
+
+def _to_arrow(chunk, schema):
+    chunk = chunk.astype({field.name: 'string' for field in schema if pa.types.is_string(field.type)})
+    return pa.Table.from_pandas(chunk, preserve_index=False).cast(schema)
+
+def materialize_table_cache(table_name="xdr_data", chunks=None, fingerprint=None, cache_dir=CACHE_DIR, chunk_size=100_000):
+    """
+    Materializes a table into a directory of Parquet part files with compact dtypes.
+
+    Handset and location columns are stored as dictionary-encoded categoricals and numeric
+    columns as int32/float32 wherever that is lossless. Every part shares one schema, which
+    is the widest storage type any chunk required.
+
+    Args:
+    - table_name (str): Name of the source table (and of the cache sub-directory).
+    - chunks (iterable of DataFrames or None): Source chunks, e.g. `pd.read_csv(path, chunksize=...)`.
+                                              Defaults to streaming the table from PostgreSQL.
+    - fingerprint (dict or None): Fingerprint to record. Computed from the database if None.
+    - cache_dir (str): Root directory of the cache.
+    - chunk_size (int): Rows per part file when streaming from the database.
+
+    Returns:
+    - str: Path of the materialized cache directory.
+    """
+    if fingerprint is None:
+        fingerprint = get_table_fingerprint(table_name)
+    if chunks is None:
+        chunks = stream_data_from_postgres_db(table_name, chunk_size=chunk_size)
+
+    table_dir = os.path.join(cache_dir, table_name)
+    staging_dir = f"{table_dir}.tmp"
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir)
+
+    plan, float32_exact = {}, {}
+    part_schemas = []
+    for part, chunk in enumerate(chunks):
+        schema = _arrow_schema(_update_dtype_plan(chunk, plan, float32_exact))
+        pq.write_table(_to_arrow(chunk, schema), os.path.join(staging_dir, f"part-{part:05d}.parquet"))
+        part_schemas.append(schema)
+
+    # Earlier parts may have been written with a narrower type than later chunks required
+    final_schema = _arrow_schema(plan)
+    for part, schema in enumerate(part_schemas):
+        if not schema.equals(final_schema):
+            path = os.path.join(staging_dir, f"part-{part:05d}.parquet")
+            pq.write_table(pq.read_table(path).cast(final_schema), path)
+
+    with open(os.path.join(staging_dir, FINGERPRINT_FILE), "w") as file:
+        json.dump(fingerprint, file)
+
+    shutil.rmtree(table_dir, ignore_errors=True)
+    os.replace(staging_dir, table_dir)
+    print(f"Cached {table_name} into {len(part_schemas)} Parquet part(s) at {table_dir}.")
+    return table_dir
+
+def load_cached_table(table_name="xdr_data", columns=None, cache_dir=CACHE_DIR, refresh=False):
+    """
+    Loads a table through the Parquet cache, rebuilding the cache when the table fingerprint changed.
+
+    Only the requested columns are read from disk. If the database cannot be reached, an existing
+    cache is used as-is.
+
+    Args:
+    - table_name (str): Name of the table to load.
+    - columns (list or None): Columns to read. Defaults to all columns.
+    - cache_dir (str): Root directory of the cache.
+    - refresh (bool): Force a rebuild of the cache.
+
+    Returns:
+    - pd.DataFrame: The (projected) table.
+    """
+    table_dir = os.path.join(cache_dir, table_name)
+    fingerprint = get_table_fingerprint(table_name)
+
+    if fingerprint is None:
+        if not os.path.isdir(table_dir):
+            raise RuntimeError(f"Database unreachable and no cache found for {table_name}.")
+        print(f"Database unreachable, using cached {table_name}.")
+    elif refresh or not is_cache_valid(table_name, fingerprint, cache_dir):
+        materialize_table_cache(table_name, fingerprint=fingerprint, cache_dir=cache_dir)
+
+    return pq.read_table(table_dir, columns=columns).to_pandas()
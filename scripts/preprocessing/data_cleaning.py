@@ -1,4 +1,12 @@
+import time
+import joblib
+import logging
 import numpy as np
+import pandas as pd
+from scripts.quantile_sketch import KLLSketch
+from scripts.preprocessing.data_transformation import optimize_dtypes
+
+logger = logging.getLogger(__name__)
 
 def impute_missing_values(dataframe, impute_strategies):
     """
@@ -19,49 +27,271 @@ def impute_missing_values(dataframe, impute_strategies):
                 dataframe[col] = dataframe[col].fillna(dataframe[col].mode()[0])
     return dataframe
 
-def handle_outliers(dataframe, method="IQR", threshold=1.5, target_columns=None):
+def _column_quantiles(values, quantiles):
+    """
+    Linear-interpolated quantiles of every column of a 2-D array, ignoring NaNs, from a single sort.
+    """
+    sorted_values = np.sort(values, axis=0)  # NaNs are sorted to the end of each column
+    counts = (~np.isnan(values)).sum(axis=0)
+    result = []
+    for q in quantiles:
+        position = q * np.maximum(counts - 1, 0)
+        below = np.floor(position).astype(np.intp)
+        above = np.minimum(below + 1, np.maximum(counts - 1, 0))
+        fraction = position - below
+        lower = np.take_along_axis(sorted_values, below[np.newaxis, :], axis=0)[0]
+        upper = np.take_along_axis(sorted_values, above[np.newaxis, :], axis=0)[0]
+        result.append(np.where(counts > 0, lower + (upper - lower) * fraction, np.nan))
+    return result
+
+def _masked_mean(values, mask):
+    counts = mask.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(mask, values, 0).sum(axis=0) / counts
+
+def _numeric_targets(dataframe, target_columns):
+    if target_columns is None:
+        target_columns = dataframe.select_dtypes(include=['number']).columns
+    return [col for col in target_columns if dataframe[col].dtype.kind in 'iuf']
+
+def _sketch_quantiles(values, quantiles, epsilon, sketches=None):
+    """
+    Approximate quantiles of every column of a 2-D array from per-column KLL sketches.
+
+    Prebuilt sketches (one per column, e.g. merged from chunks or workers) are used as-is instead
+    of sketching the array.
+    """
+    if sketches is None:
+        sketches = [KLLSketch(epsilon=epsilon).update(values[:, i]) for i in range(values.shape[1])]
+    result = np.array([sketch.quantile(quantiles) for sketch in sketches])
+    return list(result.reshape(len(sketches), len(quantiles)).T)
+
+def _column_sketches(sketches, target_columns):
+    missing = [col for col in target_columns if col not in sketches]
+    if missing:
+        raise ValueError(f"No sketch given for column(s): {', '.join(map(str, missing))}.")
+    return [sketches[col] for col in target_columns]
+
+def _fit_bounds(values, method, threshold, backend="exact", epsilon=0.01, sketches=None):
+    """
+    Computes per-column lower/upper fences and replacement values of a 2-D float array.
+    """
+    present = ~np.isnan(values)
+    if sketches is not None and method != "IQR":
+        raise ValueError("Sketches only apply to the 'IQR' method.")
+    if method == "IQR":
+        if sketches is not None:
+            Q1, Q3 = _sketch_quantiles(values, [0.25, 0.75], epsilon, sketches)
+        elif backend == "exact":
+            Q1, Q3 = _column_quantiles(values, [0.25, 0.75])
+        elif backend == "sketch":
+            Q1, Q3 = _sketch_quantiles(values, [0.25, 0.75], epsilon)
+        else:
+            raise ValueError("Invalid backend. Use 'exact' or 'sketch'.")
+        IQR = Q3 - Q1
+        lower_bound = Q1 - threshold * IQR
+        upper_bound = Q3 + threshold * IQR
+        # Outliers are replaced by the mean of the remaining (inlier) values
+        replacement = _masked_mean(values, present & (values >= lower_bound) & (values <= upper_bound))
+    elif method == "std_dev":
+        mean = _masked_mean(values, present)
+        deviations = np.where(present, values - mean, 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std_dev = np.sqrt(np.einsum('ij,ij->j', deviations, deviations) / (present.sum(axis=0) - 1))
+        lower_bound = mean - threshold * std_dev
+        upper_bound = mean + threshold * std_dev
+        replacement = mean
+    else:
+        raise ValueError("Invalid method. Use 'IQR' or 'std_dev'.")
+    return lower_bound, upper_bound, replacement
+
+def _apply_bounds(values, lower_bound, upper_bound, replacement, treatment, fill_missing):
+    """
+    Treats outliers of a 2-D float array in place.
+    """
+    missing = np.isnan(values) if fill_missing else None
+    if treatment == "replace":
+        outliers = (values < lower_bound) | (values > upper_bound)
+        np.copyto(values, np.broadcast_to(replacement, values.shape), where=outliers)
+    elif treatment == "clip":
+        np.clip(values, lower_bound, upper_bound, out=values)
+    else:
+        raise ValueError("Invalid treatment. Use 'replace' or 'clip'.")
+    if fill_missing:
+        np.copyto(values, np.broadcast_to(replacement, values.shape), where=missing)
+
+def _restored_column(column, treated):
+    """
+    Treated values of one column in the column's own dtype where they allow it, or None if nothing changed.
+
+    Integer columns keep their dtype while the treated values are integral and in range. Otherwise
+    they become float64, or float32 for columns already narrowed below int64 (e.g. by `optimize_dtypes`)
+    whose treated values round-trip exactly through float32.
     """
-    Handle outliers in numerical columns using IQR or trimming.
+    original = column.to_numpy(dtype='float64', na_value=np.nan)
+    changed = (treated != original) & ~(np.isnan(treated) & np.isnan(original))
+    if not changed.any():
+        return None
+    dtype = column.dtype
+    if dtype == 'float32':
+        return treated.astype('float32')
+    if isinstance(dtype, np.dtype) and dtype.kind in 'iu':
+        new_values = treated[changed]
+        info = np.iinfo(dtype)
+        if np.isfinite(new_values).all() and (new_values == np.round(new_values)).all() \
+                and new_values.min() >= info.min and new_values.max() <= info.max:
+            # Only the changed positions are converted, so large integers keep their exact value
+            restored = column.to_numpy(copy=True)
+            restored[changed] = new_values.astype(dtype)
+            return restored
+        if dtype.itemsize < 8:
+            narrowed = treated.astype('float32')
+            if np.array_equal(narrowed.astype('float64'), treated, equal_nan=True):
+                return narrowed
+        return treated
+    return treated
+
+def _write_back(dataframe, target_columns, values):
+    for i, col in enumerate(target_columns):
+        restored = _restored_column(dataframe[col], values[:, i])
+        if restored is not None:
+            dataframe[col] = restored
+    return dataframe
+
+def fit_outlier_bounds(dataframe, method="IQR", threshold=1.5, target_columns=None, backend="exact", epsilon=0.01, sketches=None):
+    """
+    Fits outlier bounds and replacement values for numerical columns in a single vectorized pass.
+
+    With `sketches` (e.g. built per chunk or per worker with `sketch_columns` and combined with
+    `merge_sketches`), the quartiles come from the sketches of the full data and only the
+    replacement values are computed from the dataframe.
+
+    Args:
+    - dataframe (pd.DataFrame): Input dataframe.
+    - method (str): Outlier detection method ('IQR' or 'std_dev').
+    - threshold (float): Threshold multiplier for outlier detection (default 1.5 for IQR).
+    - target_columns (list or None): Specific columns to fit. Defaults to all numerical columns.
+    - backend (str): 'exact' quartiles or approximate ones from KLL quantile 'sketch'es (IQR only).
+    - epsilon (float): Rank error of the sketches.
+    - sketches (dict or None): Column -> prebuilt KLLSketch. Overrides backend; target_columns defaults to its keys.
+
+    Returns:
+    - pd.DataFrame: 'Lower', 'Upper' and 'Replacement' values indexed by column.
+    """
+    if sketches is not None and target_columns is None:
+        target_columns = list(sketches)
+    target_columns = _numeric_targets(dataframe, target_columns)
+    values = dataframe[target_columns].to_numpy(dtype='float64')
+    column_sketches = _column_sketches(sketches, target_columns) if sketches is not None else None
+    lower_bound, upper_bound, replacement = _fit_bounds(values, method, threshold, backend, epsilon, column_sketches)
+    return pd.DataFrame({'Lower': lower_bound, 'Upper': upper_bound, 'Replacement': replacement}, index=pd.Index(target_columns))
+
+def apply_outlier_bounds(dataframe, bounds, treatment="replace", fill_missing=False):
+    """
+    Applies previously fitted outlier bounds to a dataframe, treating all columns as one 2-D block.
+
+    Args:
+    - dataframe (pd.DataFrame): Input dataframe.
+    - bounds (pd.DataFrame): Output of `fit_outlier_bounds`.
+    - treatment (str): 'replace' to substitute outliers with the fitted replacement value,
+                       or 'clip' to winsorize them to the nearest bound.
+    - fill_missing (bool): Also fill missing values with the replacement value.
+
+    Returns:
+    - pd.DataFrame: Dataframe with outliers handled.
+    """
+    target_columns = list(bounds.index)
+    values = dataframe[target_columns].to_numpy(dtype='float64', copy=True)
+    _apply_bounds(values, bounds['Lower'].to_numpy(), bounds['Upper'].to_numpy(), bounds['Replacement'].to_numpy(), treatment, fill_missing)
+    return _write_back(dataframe, target_columns, values)
+
+def handle_outliers(dataframe, method="IQR", threshold=1.5, target_columns=None, treatment="replace", bounds=None, return_bounds=False,
+                    backend="exact", epsilon=0.01, sketches=None):
+    """
+    Handle outliers in numerical columns using IQR or standard deviation fences.
 
     Args:
     - dataframe (pd.DataFrame): Input dataframe.
     - method (str): Outlier treatment method ('IQR' or 'std_dev').
     - threshold (float): Threshold multiplier for outlier detection (default 1.5 for IQR).
     - target_columns (list or None): Specific columns to treat. Defaults to all numerical columns.
+    - treatment (str): 'replace' outliers with the (inlier) mean, or 'clip' them to the bounds (winsorize).
+    - bounds (pd.DataFrame or None): Bounds fitted on another batch; skips refitting when given.
+    - return_bounds (bool): Also return the fitted bounds.
+    - backend (str): 'exact' quartiles or approximate ones from KLL quantile 'sketch'es (IQR only).
+    - epsilon (float): Rank error of the sketches.
+    - sketches (dict or None): Column -> prebuilt KLLSketch (see `fit_outlier_bounds`).
 
     Returns:
     - pd.DataFrame: Dataframe with outliers handled.
+    - pd.DataFrame: The bounds used, if return_bounds is True.
     """
-    if target_columns is None:
-        target_columns = dataframe.select_dtypes(include=['number']).columns
+    if bounds is None and sketches is not None and target_columns is None:
+        target_columns = list(sketches)
+    target_columns = list(bounds.index) if bounds is not None else _numeric_targets(dataframe, target_columns)
+    values = dataframe[target_columns].to_numpy(dtype='float64', copy=True)
 
-    if method == "IQR":
-        Q1 = dataframe[target_columns].quantile(0.25)
-        Q3 = dataframe[target_columns].quantile(0.75)
-        IQR = Q3 - Q1
-        lower_bound = Q1 - threshold * IQR
-        upper_bound = Q3 + threshold * IQR
-        # dataframe = dataframe[~((dataframe[numerical_columns] < lower_bound) | (dataframe[numerical_columns] > upper_bound)).any(axis=1)]
+    if bounds is None:
+        column_sketches = _column_sketches(sketches, target_columns) if sketches is not None else None
+        lower_bound, upper_bound, replacement = _fit_bounds(values, method, threshold, backend, epsilon, column_sketches)
+        bounds = pd.DataFrame({'Lower': lower_bound, 'Upper': upper_bound, 'Replacement': replacement}, index=pd.Index(target_columns))
 
-        for col in target_columns:
-            outliers = (dataframe[col] < lower_bound[col]) | (dataframe[col] > upper_bound[col])
-            dataframe.loc[outliers, col] = np.nan  # Replace outliers with NaN
-            dataframe[col] = dataframe[col].fillna(dataframe[col].mean())  # Impute NaNs
+    # The IQR treatment also imputes missing values with the inlier mean
+    _apply_bounds(values, bounds['Lower'].to_numpy(), bounds['Upper'].to_numpy(), bounds['Replacement'].to_numpy(),
+                  treatment, fill_missing=(method == "IQR"))
+    dataframe = _write_back(dataframe, target_columns, values)
 
-    elif method == "std_dev":
-        for col in target_columns:
-            if dataframe[col].dtype.kind in 'iufc':  # Numeric types
-                mean = dataframe[col].mean()
-                std_dev = dataframe[col].std()
-                upper_limit = mean + threshold * std_dev
-                lower_limit = mean - threshold * std_dev
-                dataframe[col] = np.where(
-                    dataframe[col] > upper_limit, mean,
-                    np.where(dataframe[col] < lower_limit, mean, dataframe[col])
-                )
+    if return_bounds:
+        return dataframe, bounds
     return dataframe
 
-def clean_dataframe(dataframe, impute_strategies=None, cat_defaults=None, outlier_method="IQR", outlier_threshold=1.5):
+def fill_categorical_defaults(dataframe, cat_defaults):
+    """
+    Fills missing values of categorical columns with default values.
+
+    Args:
+    - dataframe (pd.DataFrame): Input dataframe.
+    - cat_defaults (dict): Default value per column.
+
+    Returns:
+    - pd.DataFrame: Updated dataframe.
+    """
+    for col, default in cat_defaults.items():
+        if col in dataframe.columns and isinstance(dataframe[col].dtype, pd.CategoricalDtype) \
+                and default not in dataframe[col].cat.categories:
+            dataframe[col] = dataframe[col].cat.add_categories([default])
+    dataframe.fillna(value=cat_defaults, inplace=True)
+    return dataframe
+
+def _run_stage(stages, name, function, dataframe, deep_memory):
+    """
+    Runs one cleaning stage and records its wall time, row counts and memory delta.
+    """
+    rows_in = len(dataframe)
+    memory_before = int(dataframe.memory_usage(deep=deep_memory).sum())
+    start = time.perf_counter()
+    dataframe = function(dataframe)
+    seconds = time.perf_counter() - start
+    memory_after = int(dataframe.memory_usage(deep=deep_memory).sum())
+
+    stages.append({
+        'Stage': name,
+        'Seconds': seconds,
+        'Rows In': rows_in,
+        'Rows Out': len(dataframe),
+        'Memory Before (Bytes)': memory_before,
+        'Memory After (Bytes)': memory_after,
+        'Memory Delta (Bytes)': memory_after - memory_before
+    })
+    logger.info("%s: %.3fs, rows %d -> %d, memory delta %+d bytes", name, seconds, rows_in, len(dataframe), memory_after - memory_before)
+    return dataframe
+
+def _drop_duplicates(dataframe):
+    dataframe.drop_duplicates(inplace=True)
+    return dataframe
+
+def clean_dataframe(dataframe, impute_strategies=None, cat_defaults=None, outlier_method="IQR", outlier_threshold=1.5, optimize_memory=False,
+                    verbose=False, return_report=False, deep_memory=False, drop_duplicates=True):
     """
     Cleans the dataframe by imputing missing values, treating outliers, and removing duplicates.
 
@@ -71,34 +301,171 @@ def clean_dataframe(dataframe, impute_strategies=None, cat_defaults=None, outlie
     - cat_defaults (dict or None): Default values for categorical columns. If None, no action is performed.
     - outlier_method (str): Method to handle outliers ('IQR' or 'std_dev').
     - outlier_threshold (float): Threshold for outlier treatment (e.g., 1.5 for IQR).
+    - optimize_memory (bool): Downcast dtypes with `optimize_dtypes` before cleaning.
+    - verbose (bool): Print `info()` and `describe()` before and after cleaning (two extra full scans).
+    - return_report (bool): Also return the per-stage report (wall time, rows in/out, memory delta).
+    - deep_memory (bool): Measure memory including string contents (slower) in the report.
+    - drop_duplicates (bool): Drop duplicate rows. Disable when the caller already deduplicated on columns it removed.
 
     Returns:
     - pd.DataFrame: Cleaned dataframe.
+    - pd.DataFrame: Per-stage report, if return_report is True. Stages are also logged at INFO level.
     """
-    print("Before cleaning:")
-    print(dataframe.info())
-    print(dataframe.describe())
+    stages = []
+    instrument = return_report or logger.isEnabledFor(logging.INFO)
+
+    def run_stage(name, function, dataframe):
+        if not instrument:
+            return function(dataframe)
+        return _run_stage(stages, name, function, dataframe, deep_memory)
+
+    if optimize_memory:
+        dataframe = run_stage("optimize_dtypes", lambda frame: optimize_dtypes(frame)[0], dataframe)
+
+    if verbose:
+        print("Before cleaning:")
+        print(dataframe.info())
+        print(dataframe.describe())
 
     # Drop duplicates
-    dataframe.drop_duplicates(inplace=True)
+    if drop_duplicates:
+        dataframe = run_stage("drop_duplicates", _drop_duplicates, dataframe)
 
     # Impute categorical columns
     if cat_defaults:
-        dataframe.fillna(value=cat_defaults, inplace=True)
+        dataframe = run_stage("categorical_fill", lambda frame: fill_categorical_defaults(frame, cat_defaults), dataframe)
 
     # Impute missing values for numerical columns
     # dataframe.ffill(inplace=True)
     # dataframe.bfill(inplace=True)
     if impute_strategies is None:
         impute_strategies = {col: 'mean' for col in dataframe.select_dtypes(include=['number']).columns}
-    dataframe = impute_missing_values(dataframe, impute_strategies)
+    dataframe = run_stage("impute", lambda frame: impute_missing_values(frame, impute_strategies), dataframe)
 
     # Treat outliers
-    dataframe = handle_outliers(dataframe, method=outlier_method, threshold=outlier_threshold)
+    dataframe = run_stage("outliers", lambda frame: handle_outliers(frame, method=outlier_method, threshold=outlier_threshold), dataframe)
 
-    print("After cleaning:")
-    print(dataframe.info())
-    print(dataframe.describe())
+    if verbose:
+        print("After cleaning:")
+        print(dataframe.info())
+        print(dataframe.describe())
 
-    print("Data cleaning completed.")
+    logger.info("Data cleaning completed.")
+    if return_report:
+        return dataframe, pd.DataFrame(stages)
     return dataframe
+
+class CleaningPipeline:
+    """
+    Cleaning steps of `clean_dataframe` split into a fit step that learns the imputation values and
+    outlier bounds, and a cheap transform step that only applies them.
+
+    Fitting streams over the data once: means and modes are accumulated exactly, while outlier bounds
+    are fitted on a uniform random sample of at most `sample_size` rows. A fitted pipeline can be saved
+    to disk so ingestion workers only run `transform` on each daily batch.
+
+    Args:
+    - impute_strategies (dict or None): Columns with imputation strategies ('mean', 'mode'). If None, all numerical columns use 'mean'.
+    - cat_defaults (dict or None): Default values for categorical columns.
+    - outlier_method (str): Method to handle outliers ('IQR' or 'std_dev').
+    - outlier_threshold (float): Threshold for outlier treatment.
+    - outlier_treatment (str): 'replace' or 'clip' (see `handle_outliers`).
+    """
+
+    def __init__(self, impute_strategies=None, cat_defaults=None, outlier_method="IQR", outlier_threshold=1.5, outlier_treatment="replace"):
+        self.impute_strategies = impute_strategies
+        self.cat_defaults = cat_defaults
+        self.outlier_method = outlier_method
+        self.outlier_threshold = outlier_threshold
+        self.outlier_treatment = outlier_treatment
+        self.impute_values_ = None
+        self.bounds_ = None
+
+    def fit(self, data, sample_size=100_000, random_state=42):
+        """
+        Learns imputation values and outlier bounds.
+
+        Args:
+        - data (pd.DataFrame or iterable of pd.DataFrame): Data to fit on, e.g. the chunks of `stream_data_from_postgres_db`.
+        - sample_size (int): Maximum number of rows used to fit the outlier bounds.
+        - random_state (int): Seed of the row sample.
+
+        Returns:
+        - CleaningPipeline: self.
+        """
+        rng = np.random.default_rng(random_state)
+        chunks = [data] if isinstance(data, pd.DataFrame) else data
+        strategies = self.impute_strategies
+        sums, counts, value_counts = None, None, {}
+        sample = None
+
+        for chunk in chunks:
+            chunk = chunk.drop_duplicates()
+            if self.cat_defaults:
+                chunk = fill_categorical_defaults(chunk, self.cat_defaults)
+            if strategies is None:
+                strategies = {col: 'mean' for col in chunk.select_dtypes(include=['number']).columns}
+            mean_columns = [col for col, strategy in strategies.items() if strategy == 'mean' and col in chunk.columns]
+            mode_columns = [col for col, strategy in strategies.items() if strategy == 'mode' and col in chunk.columns]
+
+            chunk_sums, chunk_counts = chunk[mean_columns].sum(), chunk[mean_columns].count()
+            sums = chunk_sums if sums is None else sums.add(chunk_sums, fill_value=0)
+            counts = chunk_counts if counts is None else counts.add(chunk_counts, fill_value=0)
+            for col in mode_columns:
+                chunk_value_counts = chunk[col].value_counts()
+                value_counts[col] = chunk_value_counts.add(value_counts[col], fill_value=0) if col in value_counts else chunk_value_counts
+
+            # Bottom-k on random keys keeps a uniform sample without replacement across chunks
+            numeric_chunk = chunk.select_dtypes(include=['number']).assign(_sample_key=rng.random(len(chunk)))
+            sample = numeric_chunk if sample is None else pd.concat([sample, numeric_chunk])
+            if len(sample) > sample_size:
+                sample = sample.nsmallest(sample_size, '_sample_key')
+
+        if sample is None:
+            raise ValueError("Cannot fit a CleaningPipeline on empty data.")
+
+        impute_values = (sums / counts).to_dict()
+        for col, col_value_counts in value_counts.items():
+            # Highest count, ties broken by the smallest value like Series.mode()[0]
+            impute_values[col] = col_value_counts.sort_index().idxmax()
+        self.impute_values_ = impute_values
+
+        sample = sample.drop(columns='_sample_key').fillna(value=self.impute_values_)
+        self.bounds_ = fit_outlier_bounds(sample, method=self.outlier_method, threshold=self.outlier_threshold)
+        return self
+
+    def transform(self, dataframe):
+        """
+        Cleans a dataframe with the fitted statistics.
+
+        Args:
+        - dataframe (pd.DataFrame): Input dataframe.
+
+        Returns:
+        - pd.DataFrame: Cleaned dataframe.
+        """
+        if self.bounds_ is None:
+            raise RuntimeError("CleaningPipeline must be fitted before calling transform.")
+
+        dataframe = dataframe.drop_duplicates()
+        if self.cat_defaults:
+            dataframe = fill_categorical_defaults(dataframe, self.cat_defaults)
+        dataframe = dataframe.fillna(value={col: value for col, value in self.impute_values_.items() if col in dataframe.columns})
+        bounds = self.bounds_[self.bounds_.index.isin(dataframe.columns)]
+        return apply_outlier_bounds(dataframe, bounds, treatment=self.outlier_treatment, fill_missing=(self.outlier_method == "IQR"))
+
+    def fit_transform(self, dataframe, **fit_params):
+        return self.fit(dataframe, **fit_params).transform(dataframe)
+
+    def save(self, path):
+        """
+        Serializes the fitted pipeline to disk.
+        """
+        joblib.dump(self, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a pipeline written with `save`.
+        """
+        return joblib.load(path)
@@ -1,8 +1,9 @@
 import os
 import psycopg2
 import pandas as pd
+from psycopg2 import sql
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from scripts.sql_queries import bulk_write, get_engine
 
 load_dotenv()
 
@@ -34,18 +35,81 @@ def load_data_from_postgres_db(query):
 def load_data_using_sqlalchemy(query):
     
     try:
-        # connection_string = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-        connection_string = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-        engine = create_engine(connection_string)   
+        engine = get_engine('postgres')
         dataframe = pd.read_sql(query, engine)
         return dataframe
     except Exception as e:
         print(f"Error connecting to the database: {e}")
         return None
 
-def load_data_to_db(file_path, table_name):
+def load_data_to_db(file_path, table_name, chunk_size=100_000, mode="replace"):
     
-    engine = create_engine(f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}")
-    dataframe = pd.read_csv(file_path)
-    dataframe.to_sql(table_name, engine, if_exists="replace", index=False)
+    chunks = pd.read_csv(file_path, chunksize=chunk_size)
+    bulk_write(chunks, table_name, mode=mode, promote_integers=True)
     print(f"Data from {file_path} loaded to {table_name} table successfully.")
+
+def build_select_query(table_name, columns=None, where=None):
+    """
+    Composes a SELECT statement with safely quoted identifiers.
+
+    Args:
+    - table_name (str): Name of the table to read from.
+    - columns (list or None): Columns to project. Defaults to all columns.
+    - where (str or None): Optional raw SQL filter appended as a WHERE clause.
+
+    Returns:
+    - psycopg2.sql.Composed: The composed query.
+    """
+    if columns:
+        fields = sql.SQL(", ").join(sql.Identifier(column) for column in columns)
+    else:
+        fields = sql.SQL("*")
+    query = sql.SQL("SELECT {} FROM {}").format(fields, sql.Identifier(table_name))
+    if where:
+        query = query + sql.SQL(" WHERE ") + sql.SQL(where)
+    return query
+
+def stream_data_from_postgres_db(table_name="xdr_data", columns=None, chunk_size=100_000, dtypes=None, query=None):
+    """
+    Streams a table (or query result) from PostgreSQL in fixed-size DataFrame chunks.
+
+    Rows are fetched through a server-side (named) cursor, so only one chunk is
+    resident on the client at a time.
+
+    Args:
+    - table_name (str): Table to read when no query is given.
+    - columns (list or None): Columns to project. Defaults to all columns.
+    - chunk_size (int): Number of rows per yielded chunk.
+    - dtypes (dict or None): Column -> dtype mapping applied to every chunk.
+    - query (str or Composed or None): Custom query overriding table_name/columns.
+
+    Yields:
+    - pd.DataFrame: The next chunk of rows.
+    """
+    if query is None:
+        query = build_select_query(table_name, columns)
+
+    conn = psycopg2.connect(
+        host=DB_HOST,
+        port=DB_PORT,
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD
+    )
+    try:
+        with conn.cursor(name=f"{table_name}_stream") as cursor:
+            cursor.itersize = chunk_size
+            cursor.execute(query)
+            column_names = None
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                if column_names is None:
+                    column_names = [description[0] for description in cursor.description]
+                chunk = pd.DataFrame.from_records(rows, columns=column_names)
+                if dtypes:
+                    chunk = chunk.astype({col: dtype for col, dtype in dtypes.items() if col in chunk.columns})
+                yield chunk
+    finally:
+        conn.close()
@@ -36,3 +36,65 @@ def transform_data(dataframe):
     
     return transformed_dataframe
 
+def _downcast_float(series, lossy):
+    """
+    Returns the float32 version of a float64 series if that is lossless (or allowed to be lossy).
+    """
+    if series.dtype != 'float64':
+        return series
+    downcast = series.astype('float32')
+    if lossy:
+        return downcast
+    values = series.to_numpy()
+    exact = (downcast.to_numpy().astype('float64') == values) | np.isnan(values)
+    return downcast if exact.all() else series
+
+def optimize_dtypes(dataframe, categorical_threshold=0.5, datetime_columns=('Start', 'End'), lossy_floats=False):
+    """
+    Shrinks the memory footprint of a dataframe by downcasting its columns.
+
+    - Integer columns are downcast to the smallest integer type that holds their range.
+    - Float columns are downcast to float32 when every value round-trips exactly
+      (or unconditionally with lossy_floats=True). Identifiers such as MSISDN stay float64.
+    - String columns whose share of distinct values is below categorical_threshold become categoricals.
+    - datetime_columns are parsed to datetime64.
+
+    Args:
+    - dataframe (pd.DataFrame): Input dataframe.
+    - categorical_threshold (float): Maximum ratio of unique values to rows for a categorical conversion.
+    - datetime_columns (tuple): Columns to parse as datetimes, if present.
+    - lossy_floats (bool): Allow float32 downcasts that lose precision.
+
+    Returns:
+    - pd.DataFrame: Dataframe with optimized dtypes.
+    - pd.DataFrame: Per-column report of dtypes and bytes before/after.
+    """
+    report = []
+    for col in dataframe.columns:
+        series = dataframe[col]
+        bytes_before = series.memory_usage(deep=True, index=False)
+
+        if col in datetime_columns and not pd.api.types.is_datetime64_any_dtype(series):
+            optimized = pd.to_datetime(series, errors='coerce')
+        elif pd.api.types.is_integer_dtype(series):
+            optimized = pd.to_numeric(series, downcast='integer')
+        elif pd.api.types.is_float_dtype(series):
+            optimized = _downcast_float(series, lossy_floats)
+        elif series.dtype == 'object' and len(series) and series.nunique() / len(series) < categorical_threshold:
+            optimized = series.astype('category')
+        else:
+            optimized = series
+
+        dataframe[col] = optimized
+        bytes_after = optimized.memory_usage(deep=True, index=False)
+        report.append({
+            'Column': col,
+            'Dtype Before': str(series.dtype),
+            'Dtype After': str(optimized.dtype),
+            'Bytes Before': bytes_before,
+            'Bytes After': bytes_after,
+            'Bytes Saved': bytes_before - bytes_after
+        })
+
+    report = pd.DataFrame(report).sort_values('Bytes Saved', ascending=False, ignore_index=True)
+    return dataframe, report
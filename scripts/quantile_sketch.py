@@ -0,0 +1,162 @@
+import math
+import numpy as np
+import pandas as pd
+
+class KLLSketch:
+    """
+    Mergeable KLL quantile sketch of a numeric stream.
+
+    Values are kept in a stack of compactors; level h holds items of weight 2**h. When a level
+    exceeds its capacity it is sorted and every other item (random offset) is promoted to the next
+    level, so memory stays around 3k items regardless of the stream length. Sketches built over
+    disjoint chunks (or in different workers) can be merged into the sketch of their union.
+
+    Args:
+    - epsilon (float): Target normalized rank error (at ~99% confidence). Sets the compactor size k.
+    - k (int or None): Compactor size. Overrides epsilon when given.
+    - random_state (int or None): Seed for the compaction offsets.
+    """
+
+    def __init__(self, epsilon=0.01, k=None, random_state=42):
+        # Rank error of a KLL sketch is about 2.296 / k**0.9723
+        self.k = k if k is not None else max(8, math.ceil((2.296 / epsilon) ** (1 / 0.9723)))
+        self.n = 0
+        self.min = np.nan
+        self.max = np.nan
+        self._levels = [np.empty(0)]
+        self._rng = np.random.default_rng(random_state)
+
+    @property
+    def epsilon(self):
+        return 2.296 / self.k ** 0.9723
+
+    def _capacity(self, level):
+        return max(2, math.ceil(self.k * (2 / 3) ** (len(self._levels) - 1 - level)))
+
+    def _compress(self):
+        level = 0
+        while level < len(self._levels):
+            items = self._levels[level]
+            if len(items) < self._capacity(level):
+                level += 1
+                continue
+            if level + 1 == len(self._levels):
+                self._levels.append(np.empty(0))
+            items = np.sort(items)
+            # An odd item stays behind so the promoted pairs keep the total weight exact
+            start = len(items) % 2
+            promoted = items[start + self._rng.integers(2)::2]
+            self._levels[level] = items[:start]
+            self._levels[level + 1] = np.concatenate([self._levels[level + 1], promoted])
+            # Capacities shrink when a level is added, so re-check from the bottom
+            level = 0
+
+    def update(self, values):
+        """
+        Adds a batch of values (NaNs are ignored).
+
+        Returns:
+        - KLLSketch: self, to allow chaining.
+        """
+        values = np.asarray(values, dtype='float64').ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        self.n += len(values)
+        self.min = np.fmin(self.min, values.min())
+        self.max = np.fmax(self.max, values.max())
+        self._levels[0] = np.concatenate([self._levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """
+        Merges a sketch built over another part of the stream.
+        """
+        while len(self._levels) < len(other._levels):
+            self._levels.append(np.empty(0))
+        for level, items in enumerate(other._levels):
+            self._levels[level] = np.concatenate([self._levels[level], items])
+        self.n += other.n
+        self.min = np.fmin(self.min, other.min)
+        self.max = np.fmax(self.max, other.max)
+        self._compress()
+        return self
+
+    def _weighted_items(self):
+        items = np.concatenate(self._levels)
+        weights = np.concatenate([np.full(len(items), 2 ** level, dtype='float64') for level, items in enumerate(self._levels)])
+        order = np.argsort(items, kind='stable')
+        return items[order], np.cumsum(weights[order])
+
+    def quantile(self, q):
+        """
+        Approximate quantile(s) of the stream.
+
+        Args:
+        - q (float or array-like): Quantile(s) in [0, 1].
+
+        Returns:
+        - float or np.ndarray: Quantile value(s), NaN for an empty sketch.
+        """
+        scalar = np.ndim(q) == 0
+        q = np.atleast_1d(np.asarray(q, dtype='float64'))
+        if self.n == 0:
+            result = np.full(len(q), np.nan)
+        else:
+            items, cumulative = self._weighted_items()
+            positions = np.minimum(np.searchsorted(cumulative, q * self.n, side='left'), len(items) - 1)
+            result = items[positions]
+            result = np.where(q <= 0, self.min, np.where(q >= 1, self.max, result))
+        return float(result[0]) if scalar else result
+
+    def rank(self, values):
+        """
+        Approximate normalized rank (fraction of the stream <= value) of each value.
+        """
+        if self.n == 0:
+            return np.full(np.shape(values), np.nan)
+        items, cumulative = self._weighted_items()
+        positions = np.searchsorted(items, values, side='right')
+        return np.where(positions > 0, cumulative[np.maximum(positions - 1, 0)], 0) / self.n
+
+def sketch_columns(data, columns=None, epsilon=0.01, batch_size=65_536, random_state=42):
+    """
+    Builds one KLL sketch per numerical column in a single streaming pass.
+
+    Args:
+    - data (DataFrame or iterable of DataFrames): The data, or chunks of it.
+    - columns (list or None): Columns to sketch. Defaults to the numerical columns of the first chunk.
+    - epsilon (float): Target normalized rank error of each sketch.
+    - batch_size (int): Rows fed to the sketches at a time, which bounds the working memory.
+    - random_state (int or None): Seed for the compaction offsets.
+
+    Returns:
+    - dict: column -> KLLSketch.
+    """
+    chunks = [data] if isinstance(data, pd.DataFrame) else data
+    sketches = None
+    for chunk in chunks:
+        if sketches is None:
+            if columns is None:
+                columns = list(chunk.select_dtypes(include='number').columns)
+            sketches = {col: KLLSketch(epsilon=epsilon, random_state=random_state) for col in columns}
+        numeric_chunk = chunk[columns]
+        for start in range(0, len(chunk), batch_size):
+            block = numeric_chunk.iloc[start:start + batch_size].to_numpy(dtype='float64', na_value=np.nan)
+            for i, col in enumerate(columns):
+                sketches[col].update(block[:, i])
+    return sketches or {}
+
+def merge_sketches(*sketch_dicts):
+    """
+    Merges per-column sketch dicts (e.g. from different workers) into the first one.
+    """
+    merged = sketch_dicts[0]
+    for sketches in sketch_dicts[1:]:
+        for col, sketch in sketches.items():
+            if col in merged:
+                merged[col].merge(sketch)
+            else:
+                merged[col] = sketch
+    return merged
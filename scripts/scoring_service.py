@@ -0,0 +1,244 @@
+import json
+import time
+import queue
+import joblib
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from sklearn.linear_model import LinearRegression
+from scripts.aggregation import centroid_distances
+
+def save_scoring_artifacts(path, engagement_model, experience_model, engagement_centroid, experience_centroid,
+                           regression_model=None, regression_features=('Engagement Score', 'Experience Score')):
+    """
+    Bundles everything the scoring service needs into one joblib file.
+
+    Args:
+    - path (str): Output file.
+    - engagement_model (dict or str): Bundle (or its path) written by `kmeans_clustering(..., model_path=...)` on the engagement features.
+    - experience_model (dict or str): Same for the experience features.
+    - engagement_centroid (array-like): Reference centroid for the engagement score (e.g. from `find_centroid`).
+    - experience_centroid (array-like): Reference centroid for the experience score.
+    - regression_model (estimator or None): Model from `train_regression_model` predicting the satisfaction score.
+    - regression_features (tuple): Score columns the regression model was trained on.
+    """
+    if isinstance(engagement_model, str):
+        engagement_model = joblib.load(engagement_model)
+    if isinstance(experience_model, str):
+        experience_model = joblib.load(experience_model)
+    joblib.dump({
+        'engagement': {**engagement_model, 'centroid': np.asarray(engagement_centroid, dtype=np.float64)},
+        'experience': {**experience_model, 'centroid': np.asarray(experience_centroid, dtype=np.float64)},
+        'regression': regression_model,
+        'regression_features': list(regression_features)
+    }, path)
+
+class SatisfactionScorer:
+    """
+    Scores raw per-user metrics with preloaded scalers, centroids and regression model.
+
+    The hot path is plain NumPy (no pandas or sklearn input validation), so a single user is scored
+    in well under a millisecond.
+    """
+
+    def __init__(self, artifacts):
+        self.models = {}
+        for name in ('engagement', 'experience'):
+            model = artifacts[name]
+            scaler = model['scaler']
+            self.models[name] = {
+                'features': list(model['features']),
+                'mean': scaler.mean_ if scaler is not None else 0.0,
+                'scale': scaler.scale_ if scaler is not None else 1.0,
+                'cluster_centers': np.asarray(model['kmeans'].cluster_centers_, dtype=np.float64),
+                'centroid': np.asarray(model['centroid'], dtype=np.float64)
+            }
+        self.regression = artifacts.get('regression')
+        self.regression_features = artifacts.get('regression_features', ['Engagement Score', 'Experience Score'])
+        self.feature_names = self.models['engagement']['features'] + [
+            f for f in self.models['experience']['features'] if f not in self.models['engagement']['features']
+        ]
+
+    @classmethod
+    def load(cls, path):
+        return cls(joblib.load(path))
+
+    def _score_part(self, name, records):
+        model = self.models[name]
+        if isinstance(records, pd.DataFrame):
+            values = records[model['features']].to_numpy(dtype=np.float64)
+        else:
+            values = np.array([[record[feature] for feature in model['features']] for record in records], dtype=np.float64)
+        scaled = (values - model['mean']) / model['scale']
+        scores = centroid_distances(scaled, model['centroid'], dtype=np.float64)
+        clusters = centroid_distances(scaled, model['cluster_centers'], dtype=np.float64).argmin(axis=1)
+        return scores, clusters
+
+    def _satisfaction(self, engagement_scores, experience_scores):
+        if self.regression is None:
+            return (engagement_scores + experience_scores) / 2
+        columns = {'Engagement Score': engagement_scores, 'Experience Score': experience_scores}
+        X = np.column_stack([columns[feature] for feature in self.regression_features])
+        if isinstance(self.regression, LinearRegression):
+            return X @ self.regression.coef_ + self.regression.intercept_
+        return self.regression.predict(pd.DataFrame(X, columns=self.regression_features))
+
+    def score(self, records):
+        """
+        Scores one user or a batch of users.
+
+        Args:
+        - records (dict, list of dict or DataFrame): Raw per-user engagement and experience metrics.
+
+        Returns:
+        - dict, list of dict or DataFrame (matching the input): 'Engagement Score', 'Experience Score',
+          'Satisfaction Score', 'Engagement Cluster' and 'Experience Cluster' per user.
+        """
+        single = isinstance(records, dict)
+        batch = [records] if single else records
+        engagement_scores, engagement_clusters = self._score_part('engagement', batch)
+        experience_scores, experience_clusters = self._score_part('experience', batch)
+        result = {
+            'Engagement Score': engagement_scores,
+            'Experience Score': experience_scores,
+            'Satisfaction Score': self._satisfaction(engagement_scores, experience_scores),
+            'Engagement Cluster': engagement_clusters,
+            'Experience Cluster': experience_clusters
+        }
+        if isinstance(records, pd.DataFrame):
+            return pd.DataFrame(result, index=records.index)
+        rows = [dict(zip(result, values)) for values in zip(*(column.tolist() for column in result.values()))]
+        return rows[0] if single else rows
+
+class MicroBatcher:
+    """
+    Collects concurrent single-user requests and scores them together.
+
+    A batch is flushed when it reaches max_batch_size or max_wait_ms after its first request.
+    """
+
+    def __init__(self, scorer, max_batch_size=256, max_wait_ms=2.0):
+        self.scorer = scorer
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._requests = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, record):
+        # Reject malformed records up front so they cannot fail the rest of the batch
+        missing = [feature for feature in self.scorer.feature_names if feature not in record]
+        if missing:
+            raise KeyError(f"Missing metrics: {', '.join(missing)}")
+        try:
+            record = {feature: float(record[feature]) for feature in self.scorer.feature_names}
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid metric value: {e}") from e
+        future = Future()
+        self._requests.put((record, future))
+        return future
+
+    def score(self, record, timeout=1.0):
+        return self.submit(record).result(timeout=timeout)
+
+    def close(self):
+        self._requests.put(None)
+        self._worker.join()
+
+    def _run(self):
+        while True:
+            item = self._requests.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._requests.put(None)
+                    break
+                batch.append(item)
+
+            records = [record for record, _ in batch]
+            try:
+                results = self.scorer.score(records)
+            except Exception:
+                # Score the records one by one so an error only reaches the request that caused it
+                for record, future in batch:
+                    try:
+                        future.set_result(self.scorer.score(record))
+                    except Exception as e:
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+class ScoringServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+def serve(artifacts_path, host="127.0.0.1", port=8000, max_batch_size=256, max_wait_ms=2.0):
+    """
+    Runs a local HTTP scoring server.
+
+    POST /score with a JSON object (one user, micro-batched with concurrent requests) or a JSON list
+    (scored as one batch). GET /health returns {"status": "ok"}.
+    """
+    scorer = SatisfactionScorer.load(artifacts_path)
+    batcher = MicroBatcher(scorer, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+
+    class ScoringHandler(BaseHTTPRequestHandler):
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, {"status": "ok"})
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/score":
+                self._send(404, {"error": "not found"})
+                return
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                result = batcher.score(payload) if isinstance(payload, dict) else scorer.score(payload)
+                self._send(200, result)
+            except (KeyError, ValueError, TypeError) as e:
+                self._send(400, {"error": str(e)})
+            except Exception as e:
+                self._send(500, {"error": str(e)})
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ScoringServer((host, port), ScoringHandler)
+    print(f"Scoring service listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        batcher.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve engagement, experience and satisfaction scores.")
+    parser.add_argument("artifacts", help="Path of the bundle written by save_scoring_artifacts.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    serve(args.artifacts, host=args.host, port=args.port)
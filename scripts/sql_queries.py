@@ -1,49 +1,461 @@
+import io
 import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import tempfile
+import threading
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 DB_HOST = os.getenv("DB_HOST")
 DB_PORT = os.getenv("DB_PORT")
 DB_NAME = os.getenv("DB_NAME")
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+QUERY_CACHE_DIR = os.getenv("XDR_QUERY_CACHE_DIR", "data/cache/queries")
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", 64))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", 3600))
 
-def execute_queries(query, database_type='postgres'):
-    
+# Applications with '<App> DL (Bytes)' / '<App> UL (Bytes)' columns; the only names allowed into queries
+APPLICATIONS = ['Social Media', 'Google', 'Email', 'Youtube', 'Netflix', 'Gaming', 'Other']
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+def get_dsn(database_type='postgres'):
+    """
+    Builds the connection string for the configured database.
+    """
     if database_type == 'postgres':
-        engine = create_engine(f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}")
+        return f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
     elif database_type == 'mysql':
-        engine = create_engine(f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:3306/{DB_NAME}")
+        return f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:3306/{DB_NAME}"
     else:
         raise ValueError("Unsupported database type. Please use 'postgres' or 'mysql'.")
+
+def get_engine(database_type='postgres', dsn=None, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_pre_ping=True):
+    """
+    Returns the process-wide engine for a database, creating its connection pool on first use.
+
+    Engines are keyed by database type and DSN, so every query against the same database
+    reuses pooled connections instead of paying a new TCP/auth handshake.
+
+    Args:
+    - database_type (str): 'postgres' or 'mysql'.
+    - dsn (str or None): Connection string. Defaults to the one built from the environment.
+    - pool_size (int): Number of persistent connections kept in the pool.
+    - max_overflow (int): Extra connections allowed above pool_size under load.
+    - pool_pre_ping (bool): Test connections on checkout so stale ones are replaced transparently.
+
+    Returns:
+    - sqlalchemy.engine.Engine: The shared engine.
+    """
+    if dsn is None:
+        dsn = get_dsn(database_type)
+    key = (database_type, dsn)
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = create_engine(dsn, pool_size=pool_size, max_overflow=max_overflow, pool_pre_ping=pool_pre_ping)
+            _engines[key] = engine
+    return engine
+
+def dispose_engines():
+    """
+    Closes every pooled connection and clears the engine registry.
+    """
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+def execute_queries(query, database_type='postgres'):
+    
+    engine = get_engine(database_type)
     return pd.read_sql_query(query, engine)
 
-def export_to_database(data, table_name, database_type='postgres'):
+def run_many(queries, database_type='postgres', max_workers=DB_POOL_SIZE):
+    """
+    Runs several queries concurrently on one pooled engine.
+
+    Args:
+    - queries (dict): Name -> SQL string or zero-argument callable (e.g. `get_top_10_handsets`).
+    - database_type (str): Database to run SQL strings against.
+    - max_workers (int): Number of concurrent queries. Defaults to the pool size.
+
+    Returns:
+    - dict: Name -> DataFrame, in the same order as `queries`.
+    """
+    def run(query):
+        if callable(query):
+            return query()
+        return execute_queries(query, database_type)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {name: executor.submit(run, query) for name, query in queries.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+def get_table_version(table_name, database_type='postgres'):
+    """
+    Returns a cheap version stamp of a table from the catalog statistics (no table scan).
+
+    On PostgreSQL the stamp combines the table OID (which changes when the table is replaced)
+    with its insert/update/delete counters; on MySQL it uses the table's update time and row estimate.
+    Writes from other sessions show up once the server has flushed its statistics (normally within seconds).
+    """
+    if database_type == 'mysql':
+        query = ("SELECT UPDATE_TIME, TABLE_ROWS, CREATE_TIME FROM information_schema.tables "
+                 "WHERE table_schema = DATABASE() AND table_name = %(table)s")
+        params = {'table': table_name}
+    else:
+        query = ("SELECT c.oid, s.n_tup_ins, s.n_tup_upd, s.n_tup_del FROM pg_class c "
+                 "LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid WHERE c.oid = to_regclass(%(table)s)")
+        params = {'table': f'"{table_name}"'}
+    result = pd.read_sql_query(query, get_engine(database_type), params=params)
+    return "|".join(str(value) for value in result.iloc[0]) if len(result) else None
+
+class QueryCache:
+    """
+    Two-tier memoization of query results, keyed by query text and the version stamp of the tables it reads.
+
+    Results are kept in an in-memory LRU and written to Parquet files so that new processes
+    (e.g. dashboard reruns) start warm. An entry is served only while it is younger than its TTL
+    and the table versions still match; table versions themselves are re-read at most every
+    `version_ttl` seconds.
+
+    Args:
+    - cache_dir (str or None): Directory of the Parquet tier. None keeps results in memory only.
+    - max_entries (int): Number of results kept in memory.
+    - ttl (float): Default time-to-live of a result, in seconds.
+    - version_ttl (float): How long a table version stamp is trusted before it is checked again.
+    """
+
+    def __init__(self, cache_dir=QUERY_CACHE_DIR, max_entries=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL, version_ttl=5.0):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version_ttl = version_ttl
+        self.hits = {'memory': 0, 'disk': 0}
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(query, database_type):
+        return hashlib.sha256(f"{database_type}\n{' '.join(query.split())}".encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.parquet")
+
+    def _table_versions(self, tables, database_type):
+        versions = {}
+        now = time.time()
+        for table in tables:
+            with self._lock:
+                cached = self._versions.get((database_type, table))
+            if cached is None or now - cached[1] > self.version_ttl:
+                cached = (get_table_version(table, database_type), now)
+                with self._lock:
+                    self._versions[(database_type, table)] = cached
+            versions[table] = cached[0]
+        return versions
+
+    def _is_fresh(self, entry, versions, ttl):
+        return entry['versions'] == versions and time.time() - entry['created'] <= ttl
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _read_disk(self, key):
+        path = self._path(key)
+        if self.cache_dir is None or not os.path.exists(path):
+            return None
+        try:
+            table = pq.read_table(path)
+            entry = json.loads(table.schema.metadata[b'query_cache'])
+        except Exception:
+            return None
+        entry['result'] = table.to_pandas()
+        return entry
+
+    def _write_disk(self, key, entry):
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        table = pa.Table.from_pandas(entry['result'])
+        metadata = {k: v for k, v in entry.items() if k != 'result'}
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), b'query_cache': json.dumps(metadata).encode()})
+        temporary_path = f"{self._path(key)}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            pq.write_table(table, temporary_path)
+            os.replace(temporary_path, self._path(key))
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+    def fetch(self, query, tables=('xdr_data',), database_type='postgres', ttl=None, refresh=False):
+        """
+        Returns the result of a query from the cache, running it on a miss.
+
+        Args:
+        - query (str): SQL query.
+        - tables (tuple): Tables the query reads; their version stamps are part of the key.
+        - database_type (str): 'postgres' or 'mysql'.
+        - ttl (float or None): Time-to-live of this result. Defaults to the cache TTL.
+        - refresh (bool): Bypass cached results and re-run the query.
+
+        Returns:
+        - pd.DataFrame: A copy of the (cached) result.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        key = self._key(query, database_type)
+        versions = self._table_versions(tables, database_type)
+
+        if not refresh:
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is not None and self._is_fresh(entry, versions, ttl):
+                with self._lock:
+                    self._entries.move_to_end(key)
+                    self.hits['memory'] += 1
+                return entry['result'].copy()
+            entry = self._read_disk(key)
+            if entry is not None and self._is_fresh(entry, versions, ttl):
+                self._remember(key, entry)
+                with self._lock:
+                    self.hits['disk'] += 1
+                return entry['result'].copy()
+
+        with self._lock:
+            self.misses += 1
+        entry = {
+            'created': time.time(),
+            'versions': versions,
+            'tables': list(tables),
+            'result': pd.read_sql_query(query, get_engine(database_type))
+        }
+        self._remember(key, entry)
+        try:
+            self._write_disk(key, entry)
+        except Exception as e:
+            # The disk tier is best-effort: the query itself succeeded
+            logger.warning("Could not write query result to the disk cache: %s", e)
+        return entry['result'].copy()
+
+    def invalidate(self, table_name=None):
+        """
+        Drops cached results, either all of them or only those reading the given table.
+        """
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if table_name is None or table_name in entry['tables']]:
+                del self._entries[key]
+            self._versions = {key: value for key, value in self._versions.items() if table_name is not None and key[1] != table_name}
+        if self.cache_dir is None or not os.path.isdir(self.cache_dir):
+            return
+        for file_name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, file_name)
+            if table_name is not None:
+                try:
+                    metadata = json.loads(pq.read_schema(path).metadata[b'query_cache'])
+                except Exception:
+                    continue
+                if table_name not in metadata['tables']:
+                    continue
+            os.remove(path)
+
+    def stats(self):
+        """
+        Returns hit/miss counters and the number of results held in memory.
+        """
+        with self._lock:
+            requests = self.hits['memory'] + self.hits['disk'] + self.misses
+            return {
+                'memory_hits': self.hits['memory'],
+                'disk_hits': self.hits['disk'],
+                'misses': self.misses,
+                'hit_rate': (requests - self.misses) / requests if requests else 0.0,
+                'entries': len(self._entries)
+            }
+
+query_cache = QueryCache()
+
+def cached_query(query, tables=('xdr_data',), database_type='postgres', ttl=None, refresh=False):
+    """
+    Runs a query through the shared `query_cache` (see `QueryCache.fetch`).
+    """
+    return query_cache.fetch(query, tables=tables, database_type=database_type, ttl=ttl, refresh=refresh)
+
+def export_to_database(data, table_name, database_type='postgres', mode='replace', key_columns=('MSISDN/Number',), chunk_size=100_000, bulk=True):
     """
     Exports data to a database table.
     Args:
         data (pd.DataFrame): DataFrame to export.
         table_name (str): Name of the Database table.
         database_type (str): Type of database to export to. Defaults to 'postgres'.
+        mode (str): 'replace', 'append' or 'upsert' (rows replaced by key_columns).
+        key_columns (tuple): Key used by the 'upsert' mode. Defaults to the user MSISDN.
+        chunk_size (int): Rows per COPY batch.
+        bulk (bool): Use the COPY/LOAD DATA writer instead of `DataFrame.to_sql`.
     """
-    if database_type == 'mysql':
-        engine = create_engine(f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:3306/{DB_NAME}")
-    else:
-        engine = create_engine(f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}")
+    if bulk:
+        chunks = (data.iloc[start:start + chunk_size] for start in range(0, max(len(data), 1), chunk_size))
+        bulk_write(chunks, table_name, database_type, mode=mode, key_columns=key_columns)
+        print(f"Data exported to {table_name} table in {DB_NAME} database.")
+        return
+
+    if mode not in ('replace', 'append'):
+        raise ValueError("Only 'replace' and 'append' are supported without bulk=True.")
+    engine = get_engine(database_type)
     
     with engine.connect() as connection:
-        data.to_sql(table_name, con=connection, if_exists="replace", index=False)
+        data.to_sql(table_name, con=connection, if_exists=mode, index=False)
         print(f"Data exported to {table_name} table in {DB_NAME} database.")
 
+def _staging_ddl(engine, chunk, staging_table, promote_integers):
+    """
+    Builds the CREATE TABLE statement of the staging table from the first chunk.
+    Integer columns can be promoted to floats when later chunks may contain missing values.
+    """
+    template = chunk.head(0)
+    if promote_integers:
+        template = template.astype({col: 'float64' for col in template.select_dtypes(include='integer').columns})
+    return pd.io.sql.get_schema(template, staging_table, con=engine)
+
+def _copy_chunk_postgres(cursor, chunk, quoted_table, quoted_columns):
+    buffer = io.StringIO()
+    chunk.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {quoted_table} ({quoted_columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+def _copy_chunk_mysql(cursor, chunk, quoted_table, quoted_columns):
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, newline="") as file:
+        chunk.to_csv(file, index=False, header=False, na_rep="\\N")
+    try:
+        path = file.name.replace("\\", "/")
+        cursor.execute(
+            f"LOAD DATA LOCAL INFILE '{path}' INTO TABLE {quoted_table} "
+            "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' LINES TERMINATED BY '\\n' "
+            f"({quoted_columns})"
+        )
+    finally:
+        os.remove(file.name)
+
+def _table_exists(cursor, database_type, table_name):
+    if database_type == 'mysql':
+        cursor.execute("SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s", (table_name,))
+    else:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (f'"{table_name}"',))
+    return bool(cursor.fetchone()[0])
+
+def bulk_write(chunks, table_name, database_type='postgres', mode='replace', key_columns=('MSISDN/Number',), promote_integers=False):
+    """
+    Writes DataFrame chunks through PostgreSQL `COPY FROM STDIN` (or MySQL `LOAD DATA LOCAL INFILE`).
+
+    All chunks are loaded into a staging table first, so readers never see a partially loaded
+    table. On PostgreSQL the target is then swapped (replace), extended (append) or has its rows
+    for the staged keys replaced (upsert) in a single transaction. On MySQL, CREATE/DROP TABLE
+    commit implicitly, so only the final `RENAME TABLE` swap of a replace is atomic; append and
+    upsert run DELETE and INSERT in one transaction, but the staging table itself is not rolled back.
+
+    Args:
+        chunks (iterable of pd.DataFrame): Data to write, e.g. `pd.read_csv(path, chunksize=...)`.
+        table_name (str): Name of the target table.
+        database_type (str): 'postgres' or 'mysql'.
+        mode (str): 'replace', 'append' or 'upsert'.
+        key_columns (tuple): Columns identifying a row for the 'upsert' mode.
+        promote_integers (bool): Store integer columns of the first chunk as floats in the new table.
+    """
+    if mode not in ('replace', 'append', 'upsert'):
+        raise ValueError("Unsupported mode. Please use 'replace', 'append' or 'upsert'.")
+
+    if database_type == 'mysql':
+        engine = get_engine(database_type, dsn=f"{get_dsn('mysql')}?local_infile=1")
+        copy_chunk = _copy_chunk_mysql
+    else:
+        engine = get_engine(database_type)
+        copy_chunk = _copy_chunk_postgres
+
+    quote = engine.dialect.identifier_preparer.quote
+    staging_table = f"{table_name}_staging_{uuid.uuid4().hex[:8]}"
+    target, staging = quote(table_name), quote(staging_table)
+
+    connection = engine.raw_connection()
+    cursor = connection.cursor()
+    try:
+        columns = None
+        for chunk in chunks:
+            if columns is None:
+                columns = list(chunk.columns)
+                cursor.execute(_staging_ddl(engine, chunk, staging_table, promote_integers))
+                quoted_columns = ", ".join(quote(col) for col in columns)
+            if len(chunk):
+                copy_chunk(cursor, chunk[columns], staging, quoted_columns)
+        if columns is None:
+            raise ValueError("No data to write.")
+
+        target_exists = _table_exists(cursor, database_type, table_name)
+        if mode == 'replace' or not target_exists:
+            if database_type == 'mysql':
+                if target_exists:
+                    backup = quote(f"{table_name}_old_{uuid.uuid4().hex[:8]}")
+                    cursor.execute(f"RENAME TABLE {target} TO {backup}, {staging} TO {target}")
+                    cursor.execute(f"DROP TABLE {backup}")
+                else:
+                    cursor.execute(f"RENAME TABLE {staging} TO {target}")
+            else:
+                cursor.execute(f"DROP TABLE IF EXISTS {target}")
+                cursor.execute(f"ALTER TABLE {staging} RENAME TO {target}")
+        else:
+            if mode == 'upsert':
+                condition = " AND ".join(f"t.{quote(col)} = s.{quote(col)}" for col in key_columns)
+                if database_type == 'mysql':
+                    cursor.execute(f"DELETE t FROM {target} t JOIN {staging} s ON {condition}")
+                else:
+                    cursor.execute(f"DELETE FROM {target} t USING {staging} s WHERE {condition}")
+            cursor.execute(f"INSERT INTO {target} ({quoted_columns}) SELECT {quoted_columns} FROM {staging}")
+            cursor.execute(f"DROP TABLE {staging}")
+        connection.commit()
+    except Exception:
+        # Best-effort cleanup; a broken connection must not hide the original error
+        try:
+            connection.rollback()
+            cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+            connection.commit()
+        except Exception as cleanup_error:
+            logger.warning("Could not drop staging table %s: %s", staging_table, cleanup_error)
+        raise
+    finally:
+        try:
+            connection.close()
+        except Exception:
+            pass
+    query_cache.invalidate(table_name)
+
 def get_unique_imsi_count():
     query = """
                 SELECT COUNT(DISTINCT "IMSI") AS "Unique IMSI Count"
                 FROM xdr_data;
             """
-    return execute_queries(query)
+    return cached_query(query)
 
 def get_average_duration():
     query = """
@@ -51,7 +463,7 @@ def get_average_duration():
                 FROM xdr_data
                 WHERE "Dur. (ms)" IS NOT NULL;
             """
-    return execute_queries(query)
+    return cached_query(query)
 
 def get_total_data_usage():
     query = """
@@ -63,7 +475,7 @@ def get_total_data_usage():
                 ORDER BY "Total DL Bytes" DESC
                 LIMIT 10;
             """
-    return execute_queries(query)
+    return cached_query(query)
 
 def get_top_10_handsets():
     query = """
@@ -75,7 +487,7 @@ def get_top_10_handsets():
                 ORDER BY "Usage Count" DESC
                 LIMIT 10;
             """
-    return execute_queries(query)
+    return cached_query(query)
 
 def get_top_3_manufacturers():
     query = """
@@ -87,7 +499,7 @@ def get_top_3_manufacturers():
                 ORDER BY "Usage Count" DESC
                 LIMIT 3;
             """
-    return execute_queries(query)
+    return cached_query(query)
 
 def get_top_handsets_by_manufacturers():
     query = """
@@ -108,7 +520,7 @@ def get_top_handsets_by_manufacturers():
                 GROUP BY "Handset Manufacturer", "Handset Type"
                 ORDER BY "Handset Manufacturer", "Usage Count" DESC;
             """
-    return execute_queries(query)
+    return cached_query(query)
 
 def get_total_data_usage_by_user():
     query = """
@@ -123,7 +535,7 @@ def get_total_data_usage_by_user():
                 GROUP BY "MSISDN/Number"
                 ORDER BY "Total Data (Bytes)" DESC;
             """
-    return execute_queries(query)
+    return cached_query(query)
 
 def get_avg_duration_by_location():
     query = """
@@ -134,7 +546,7 @@ def get_avg_duration_by_location():
                 GROUP BY "Last Location Name"
                 ORDER BY "Avg Duration" DESC;
             """
-    return execute_queries(query)
+    return cached_query(query)
 
 def get_avg_duration_by_manufacturer():
     query = """
@@ -145,7 +557,7 @@ def get_avg_duration_by_manufacturer():
                 GROUP BY "Handset Manufacturer"
                 ORDER BY "Avg Duration" DESC;
             """
-    return execute_queries(query)
+    return cached_query(query)
 
 def get_avg_duration_by_handset_type():
     query = """
@@ -156,9 +568,15 @@ def get_avg_duration_by_handset_type():
                 GROUP BY "Handset Type"
                 ORDER BY "Avg Duration" DESC;
             """
-    return execute_queries(query)
+    return cached_query(query)
+
+def _check_applications(applications):
+    unknown = [app for app in applications if app not in APPLICATIONS]
+    if unknown:
+        raise ValueError(f"Unknown application(s): {', '.join(map(str, unknown))}. Use any of {', '.join(APPLICATIONS)}.")
 
 def get_total_data_usage_by_application(application):
+    _check_applications([application])
     query = f"""
                 SELECT 
                     "MSISDN/Number" AS "UserID",
@@ -167,4 +585,66 @@ def get_total_data_usage_by_application(application):
                 FROM xdr_data
                 ORDER BY "Total Data (Bytes)" DESC;
             """
-    return execute_queries(query)
+    return cached_query(query)
+
+def get_data_usage_by_applications(applications=APPLICATIONS, top_n=None):
+    """
+    Per-user data usage of several applications in a single scan of xdr_data.
+
+    Application names are checked against `APPLICATIONS` before they are used as identifiers;
+    missing DL/UL values count as zero.
+
+    Args:
+    - applications (list): Applications to include. Defaults to all of them.
+    - top_n (int or None): If given, only the top_n users of each application are returned,
+                           ranked in SQL with window functions.
+
+    Returns:
+    - pd.DataFrame: Without top_n, one row per user with 'UserID', 'Total Data (Bytes)' and one
+                    '<App> Data Volume' column per application. With top_n, one row per application
+                    and rank with 'Application', 'Rank', 'UserID', 'Application Data Volume' and
+                    'Total Data (Bytes)'.
+    """
+    applications = list(applications)
+    _check_applications(applications)
+    volumes = ",\n".join(
+        f'SUM(COALESCE("{app} DL (Bytes)", 0) + COALESCE("{app} UL (Bytes)", 0)) AS "{app} Data Volume"'
+        for app in applications
+    )
+    usage = f"""
+                SELECT 
+                    "MSISDN/Number" AS "UserID",
+                    SUM(COALESCE("Total DL (Bytes)", 0) + COALESCE("Total UL (Bytes)", 0)) AS "Total Data (Bytes)",
+                    {volumes}
+                FROM xdr_data
+                WHERE "MSISDN/Number" IS NOT NULL
+                GROUP BY "MSISDN/Number"
+            """
+    if top_n is None:
+        return cached_query(f'{usage} ORDER BY "Total Data (Bytes)" DESC;')
+
+    top_n = int(top_n)
+    ranks = ",\n".join(
+        f'ROW_NUMBER() OVER (ORDER BY "{app} Data Volume" DESC, "UserID") AS "{app} Rank"'
+        for app in applications
+    )
+    per_application = "\nUNION ALL\n".join(
+        f"""SELECT '{app}' AS "Application", "{app} Rank" AS "Rank", "UserID",
+                   "{app} Data Volume" AS "Application Data Volume", "Total Data (Bytes)"
+            FROM ranked WHERE "{app} Rank" <= {top_n}"""
+        for app in applications
+    )
+    query = f"""
+                WITH usage AS ({usage}),
+                ranked AS (
+                    SELECT usage.*,
+                        {ranks}
+                    FROM usage
+                )
+                SELECT * FROM ({per_application}) AS top_users
+                ORDER BY "Application", "Rank";
+            """
+    result = cached_query(query)
+    # Keep the requested application order rather than the alphabetical one
+    result['Application'] = pd.Categorical(result['Application'], categories=applications)
+    return result.sort_values(['Application', 'Rank'], ignore_index=True).astype({'Application': 'object'})
@@ -0,0 +1,109 @@
+import heapq
+import itertools
+import numpy as np
+import pandas as pd
+
+class TopKAccumulator:
+    """
+    Bounded min-heaps tracking the k largest rows of several metrics at once.
+
+    Each `update` receives per-key aggregates (every key at most once across updates, e.g. the
+    per-user rows of a finished aggregation or of user-partitioned chunks). Per chunk, only the rows
+    that can still enter the top k (found with an O(n) partition) are pushed onto the heaps, so no
+    table is ever sorted. Ties are resolved like `DataFrame.nlargest(keep='first')`.
+
+    Args:
+    - k (int): Number of rows to keep per metric.
+    - metrics (list or None): Columns to rank by. Defaults to every numerical column of the first chunk.
+    - columns (list or None): Columns kept for each top row. Defaults to all columns.
+    """
+
+    def __init__(self, k=10, metrics=None, columns=None):
+        self.k = k
+        self.metrics = metrics
+        self.columns = columns
+        self._heaps = {}
+        self._result_columns = columns
+        self._rows_seen = 0
+        self._tiebreak = itertools.count()
+
+    def _candidates(self, values):
+        """
+        Positions of the (at most k) non-null values that could belong to the top k of this chunk.
+
+        Values tied with the kth largest are taken in row order, like `nlargest(keep='first')`,
+        so heavy ties cannot grow the candidate set.
+        """
+        valid = np.flatnonzero(~np.isnan(values))
+        if len(valid) <= self.k:
+            return valid
+        kth_largest = np.partition(values[valid], len(valid) - self.k)[len(valid) - self.k]
+        larger = valid[values[valid] > kth_largest]
+        tied = valid[values[valid] == kth_largest][:self.k - len(larger)]
+        return np.sort(np.concatenate([larger, tied]))
+
+    def update(self, dataframe):
+        """
+        Folds a chunk of per-key aggregates into the heaps.
+
+        Args:
+        - dataframe (DataFrame): Chunk containing the metric columns.
+
+        Returns:
+        - TopKAccumulator: self, to allow chaining.
+        """
+        if self.metrics is None:
+            self.metrics = list(dataframe.select_dtypes(include=['number']).columns)
+        columns = self.columns if self.columns is not None else list(dataframe.columns)
+        if self._result_columns is None:
+            self._result_columns = columns
+
+        for metric in self.metrics:
+            heap = self._heaps.setdefault(metric, [])
+            values = dataframe[metric].to_numpy(dtype='float64', na_value=np.nan)
+            candidates = self._candidates(values)
+            rows = dataframe[columns].iloc[candidates]
+            for position, (label, row) in zip(candidates, zip(rows.index, rows.to_dict('records'))):
+                # Earlier rows win ties: a smaller -sequence ranks lower in the min-heap
+                entry = (values[position], -(self._rows_seen + position), next(self._tiebreak), label, row)
+                if len(heap) < self.k:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+
+        self._rows_seen += len(dataframe)
+        return self
+
+    def merge(self, other):
+        """
+        Merges the heaps of an accumulator built over a disjoint set of keys.
+        """
+        for metric, entries in other._heaps.items():
+            heap = self._heaps.setdefault(metric, [])
+            for value, sequence, _, label, row in entries:
+                entry = (value, sequence - self._rows_seen, next(self._tiebreak), label, row)
+                if len(heap) < self.k:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+        if self.metrics is None:
+            self.metrics = other.metrics
+        if self._result_columns is None:
+            self._result_columns = other._result_columns
+        self._rows_seen += other._rows_seen
+        return self
+
+    def result(self, metric):
+        """
+        Returns the top k rows of a metric, largest first, with their original index labels.
+        An empty result keeps the expected columns.
+        """
+        entries = sorted(self._heaps.get(metric, []), reverse=True)
+        return pd.DataFrame([row for *_, row in entries], index=[label for *_, label, _ in entries],
+                            columns=self._result_columns)
+
+    def results(self):
+        """
+        Returns a dict of metric -> top k rows.
+        """
+        return {metric: self.result(metric) for metric in self.metrics or []}
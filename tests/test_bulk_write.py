@@ -0,0 +1,65 @@
+import os
+import uuid
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, text
+from scripts import sql_queries
+
+TEST_DSN = os.getenv("XDR_TEST_POSTGRES_DSN")
+
+pytestmark = pytest.mark.skipif(TEST_DSN is None, reason="XDR_TEST_POSTGRES_DSN is not set")
+
+@pytest.fixture
+def engine(monkeypatch):
+    engine = create_engine(TEST_DSN)
+    monkeypatch.setattr(sql_queries, "get_engine", lambda database_type='postgres', dsn=None: engine)
+    monkeypatch.setattr(sql_queries, "query_cache", sql_queries.QueryCache(cache_dir=None))
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def table_name(engine):
+    name = f"bulk_write_test_{uuid.uuid4().hex[:8]}"
+    yield name
+    with engine.begin() as connection:
+        connection.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+
+def _read(engine, table_name):
+    return pd.read_sql_query(f'SELECT * FROM "{table_name}" ORDER BY "MSISDN/Number"', engine).reset_index(drop=True)
+
+def _frame(msisdns, traffic):
+    return pd.DataFrame({'MSISDN/Number': msisdns, 'Total Traffic': traffic})
+
+def _leftover_staging_tables(engine, table_name):
+    query = text("SELECT COUNT(*) FROM pg_tables WHERE tablename LIKE :pattern")
+    with engine.connect() as connection:
+        return connection.execute(query, {'pattern': f"{table_name}_staging_%"}).scalar()
+
+def test_replace_writes_all_chunks(engine, table_name):
+    chunks = [_frame([1, 2], [10.0, 20.0]), _frame([3], [30.0])]
+    sql_queries.bulk_write(iter(chunks), table_name, mode='replace')
+    pd.testing.assert_frame_equal(_read(engine, table_name), pd.concat(chunks, ignore_index=True), check_dtype=False)
+
+    sql_queries.bulk_write([_frame([4], [40.0])], table_name, mode='replace')
+    pd.testing.assert_frame_equal(_read(engine, table_name), _frame([4], [40.0]), check_dtype=False)
+    assert _leftover_staging_tables(engine, table_name) == 0
+
+def test_append_keeps_existing_rows(engine, table_name):
+    sql_queries.bulk_write([_frame([1, 2], [10.0, 20.0])], table_name, mode='replace')
+    sql_queries.bulk_write([_frame([3], [30.0])], table_name, mode='append')
+    pd.testing.assert_frame_equal(_read(engine, table_name), _frame([1, 2, 3], [10.0, 20.0, 30.0]), check_dtype=False)
+
+def test_upsert_replaces_rows_of_staged_keys(engine, table_name):
+    sql_queries.bulk_write([_frame([1, 2], [10.0, 20.0])], table_name, mode='replace')
+    sql_queries.bulk_write([_frame([2, 3], [25.0, 30.0])], table_name, mode='upsert', key_columns=('MSISDN/Number',))
+    pd.testing.assert_frame_equal(_read(engine, table_name), _frame([1, 2, 3], [10.0, 25.0, 30.0]), check_dtype=False)
+    assert _leftover_staging_tables(engine, table_name) == 0
+
+def test_failed_write_drops_staging_table(engine, table_name):
+    def chunks():
+        yield _frame([1], [10.0])
+        raise RuntimeError("source failed")
+
+    with pytest.raises(RuntimeError, match="source failed"):
+        sql_queries.bulk_write(chunks(), table_name, mode='replace')
+    assert _leftover_staging_tables(engine, table_name) == 0
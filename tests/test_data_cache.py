@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from scripts.preprocessing.data_cache import _update_dtype_plan, materialize_table_cache
+
+def _materialize(tmp_path, chunks):
+    table_dir = materialize_table_cache("xdr_test", chunks=iter(chunks), fingerprint={'row_count': 0}, cache_dir=str(tmp_path))
+    return pq.read_table(table_dir).to_pandas()
+
+@pytest.mark.parametrize("chunks, expected_dtype", [
+    # A float64 plan must not narrow back to an integer type
+    ([[0.1, np.nan], [3, 4]], 'float64'),
+    # int32 values beyond float32's exact range must not move to float32
+    ([[16777217, 5], [3.0, np.nan]], 'float64'),
+    ([[1, 2], [3_000_000_000, 4]], 'int64'),
+    ([[1, 2], [0.5, np.nan]], 'float32'),
+    ([[0.5, np.nan], [1, 2]], 'float32'),
+    ([[3_000_000_000, 1], [0.5, 2]], 'float64'),
+])
+def test_mixed_dtype_chunks_round_trip(tmp_path, chunks, expected_dtype):
+    frames = [pd.DataFrame({'Value': values}) for values in chunks]
+    result = _materialize(tmp_path, frames)
+    assert result['Value'].dtype == expected_dtype
+    expected = pd.concat(frames, ignore_index=True)['Value'].astype('float64')
+    np.testing.assert_array_equal(result['Value'].astype('float64').to_numpy(), expected.to_numpy())
+
+def test_plan_only_widens():
+    plan, float32_exact = {}, {}
+    for values in ([0.1, np.nan], [3, 4], [5, 6]):
+        _update_dtype_plan(pd.DataFrame({'Value': values}), plan, float32_exact)
+    assert plan['Value'] == 'float64'